@@ -0,0 +1,223 @@
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Frames are rendered through SDL's dummy video driver, so no display is needed
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+
+import constants
+import dxf_viewer
+import landmarks
+import nav_engine
+import synthetic_plan
+
+# Bump whenever the layout of the results file changes
+FORMAT_VERSION = 1
+DEFAULT_SIZES = (1000, 10000)
+# A stage this many times slower (or hungrier) than the baseline counts as a regression...
+REGRESSION_RATIO = 1.25
+# ...unless it grew by less than this, which is noise for stages that take next to nothing
+NOISE_FLOOR = {'seconds': 0.002, 'peak_bytes': 1 << 20}
+
+
+def measure(fn, repeat=3, memory=True):
+    """Times fn() and returns { 'seconds': best of `repeat` calls, 'peak_bytes': peak traced by one more call }.
+
+    Anything fn prints is discarded. Peak memory comes from tracemalloc, so it
+    counts Python and NumPy allocations made during the call, not SDL surfaces.
+    """
+    result = {}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        best = float('inf')
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        result['seconds'] = best
+        if memory:
+            gc.collect()
+            tracemalloc.start()
+            try:
+                fn()
+                result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    return result
+
+
+def bench_plan(path, queries=200, frames=10, repeat=3, memory=True):
+    """Runs every stage on one DXF; returns { stage: measurement }, in the order they ran."""
+    stages = {}
+
+    def run(stage, fn, calls=None):
+        stages[stage] = measure(fn, repeat, memory)
+        if calls is not None:
+            stages[stage]['calls'] = calls
+        peak = stages[stage].get('peak_bytes')
+        peak = f"{peak / 2**20:9.1f} MiB" if peak is not None else ""
+        print(f"  {stage:<26}{stages[stage]['seconds'] * 1000:12.2f} ms{peak}")
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        viewer = dxf_viewer.DXFViewer(path, use_cache=False)
+    run('load_file', viewer.load_file)
+    run('group_entities_by_layer', viewer.group_entities_by_layer)
+    run('auto_fit_view', viewer.auto_fit_view)
+
+    engine = nav_engine.NavigationEngine(snapping_threshold=constants.SNAPPING_THRESHOLD)
+    entities = viewer.get_entities()
+    run('build_graph', lambda: engine.build_graph(entities))
+
+    rnd = random.Random(0)
+    names = sorted(engine.nodes)
+    pairs = [(rnd.choice(names), rnd.choice(names)) for _ in range(queries)] if names else []
+
+    def single_queries():
+        engine.load_compact(engine.compact)  # drops cached trees, so every run starts cold
+        for source, target in pairs:
+            engine.shortest_path(source, target)
+
+    def batch_queries():
+        engine.load_compact(engine.compact)
+        engine.route_many(pairs)
+
+    run('shortest_path', single_queries, len(pairs))
+    run('route_many', batch_queries, len(pairs))
+
+    # One process, so the number does not depend on how many cores the machine has
+    run('build_landmarks', lambda: landmarks.build_landmarks(engine.compact, max_workers=1))
+    table = landmarks.build_landmarks(engine.compact, max_workers=1)
+
+    def alt_queries():
+        engine.load_compact(engine.compact)
+        engine.use_landmarks(table)
+        for source, target in pairs:
+            engine.shortest_path(source, target)
+
+    run('shortest_path_alt', alt_queries, len(pairs))
+
+    viewer.open_window()
+
+    def first_frame():
+        viewer.invalidate_layer_surfaces()  # rasterizes every layer again
+        viewer.draw_frame()
+
+    def steady_frames():
+        for _ in range(frames):
+            viewer.draw_frame()
+
+    run('render_first_frame', first_frame, 1)
+    run('render_frame', steady_frames, frames)
+    pygame.quit()
+    return stages
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, queries=200, frames=10, repeat=3, memory=True, keep_dir=None):
+    """Generates a synthetic plan per size and benchmarks it; returns the results document."""
+    results = {
+        'format': FORMAT_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'plans': [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = keep_dir or tmp
+        os.makedirs(directory, exist_ok=True)
+        for elements in sizes:
+            path = os.path.join(directory, f"synthetic-{elements}.dxf")
+            waypoints, tracklines, walls = synthetic_plan.write_plan(path, elements)
+            print(f"Plan of {elements} elements: {waypoints} waypoints, {tracklines} track lines, {walls} walls")
+            results['plans'].append({
+                'elements': elements,
+                'waypoints': waypoints,
+                'tracklines': tracklines,
+                'walls': walls,
+                'file_bytes': os.path.getsize(path),
+                'stages': bench_plan(path, queries, frames, repeat, memory),
+            })
+    return results
+
+
+def compare(baseline, current, ratio=REGRESSION_RATIO):
+    """Prints how `current` compares to `baseline`, stage by stage; returns the number of regressions.
+
+    Plans are matched by size and stages by name; ones only in one of the two are skipped.
+    """
+    regressions = 0
+    old_plans = {plan['elements']: plan for plan in baseline['plans']}
+    for plan in current['plans']:
+        old = old_plans.get(plan['elements'])
+        if old is None:
+            continue
+        print(f"Plan of {plan['elements']} elements")
+        for stage, now in plan['stages'].items():
+            before = old['stages'].get(stage)
+            if before is None:
+                continue
+            for key, unit, scale in (('seconds', 'ms', 1000), ('peak_bytes', 'MiB', 1 / 2**20)):
+                if key not in now or key not in before:
+                    continue
+                change = now[key] / before[key] if before[key] else 1.0
+                flag = ""
+                if change > ratio and now[key] - before[key] > NOISE_FLOOR[key]:
+                    flag = "  REGRESSION"
+                    regressions += 1
+                print(f"  {stage:<26}{before[key] * scale:12.2f} -> {now[key] * scale:12.2f} {unit:<4}"
+                      f"x{change:5.2f}{flag}")
+    return regressions
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        results = json.load(f)
+    if results.get('format') != FORMAT_VERSION:
+        raise ValueError(f"'{path}' has results format {results.get('format')}, expected {FORMAT_VERSION}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark loading, graph building, routing and rendering on synthetic floor plans.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help="plan sizes, in entities")
+    parser.add_argument('--queries', type=int, default=200, help="route queries per plan")
+    parser.add_argument('--frames', type=int, default=10, help="frames rendered per plan")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per stage; the best time is kept")
+    parser.add_argument('--no-memory', action='store_true', help="skip the extra traced run that measures peak memory")
+    parser.add_argument('--keep', metavar='DIR', help="write the synthetic plans here and keep them")
+    parser.add_argument('--output', metavar='FILE', help="write the results as JSON")
+    parser.add_argument('--baseline', metavar='FILE', help="compare against earlier results; exit 1 on regressions")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help="only compare two results files")
+    parser.add_argument('--ratio', type=float, default=REGRESSION_RATIO, help="slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.compare:
+            baseline, current = (load_results(path) for path in args.compare)
+        else:
+            baseline = load_results(args.baseline) if args.baseline else None
+            current = run_benchmarks(args.sizes, args.queries, args.frames, args.repeat, not args.no_memory, args.keep)
+            if args.output:
+                with open(args.output, 'w', encoding='utf-8') as f:
+                    json.dump(current, f, indent=2)
+                print(f"✓ Results written to '{args.output}'")
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    if baseline is not None and compare(baseline, current, args.ratio):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
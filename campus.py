@@ -0,0 +1,234 @@
+import argparse
+import heapq
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import constants
+import graph_cache
+import headless
+import nav_engine
+
+
+class Floor:
+    """One floor plan of the campus: a name, its DXF and the elevation its waypoints sit at."""
+
+    def __init__(self, name, filename, elevation=0.0):
+        self.name = name
+        self.filename = filename
+        self.elevation = elevation
+        self.engine = None      # NavigationEngine, once loaded
+        self.connectors = []    # [ "Waypoint_Name", ... ] stair / lift waypoints on this floor
+
+
+def is_connector(name):
+    return name.startswith(constants.CONNECTOR_PREFIXES)
+
+
+def _prepare_floor(filename, snapping_threshold, cache_dir):
+    """Worker: parse one DXF and write its graph cache; returns the cache key for the parent to map."""
+    headless.load_engine(filename, snapping_threshold, cache_dir=cache_dir)
+    return graph_cache.cache_key(filename, snapping_threshold)
+
+
+class Campus:
+    """Floors stitched together through stair and lift connectors, with hierarchical routing.
+
+    Connector waypoints are the ones whose ID starts with one of
+    constants.CONNECTOR_PREFIXES; the same ID on two floors is the same
+    stair or lift shaft. Routing across floors runs on a small overlay graph
+    whose nodes are the connectors: its edges are connector-to-connector
+    distances within each floor (precomputed) and the vertical hops between
+    floors. A query only searches the start floor and the destination
+    floor; every floor in between is crossed on the overlay.
+    """
+
+    def __init__(self, floors, snapping_threshold=constants.SNAPPING_THRESHOLD, cache_dir=None):
+        self.floors = {floor.name: floor for floor in floors}
+        self.threshold = snapping_threshold
+        self.cache_dir = cache_dir
+        self.overlay = {}  # { (floor, connector): { (floor, connector): distance } }
+
+    def load(self, max_workers=None):
+        """Parses every floor in parallel across a process pool, then maps the cached graphs in."""
+        floors = list(self.floors.values())
+        if max_workers is None:
+            max_workers = min(len(floors), os.cpu_count() or 1)
+
+        if max_workers > 1:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                keys = list(pool.map(_prepare_floor, [f.filename for f in floors],
+                                     [self.threshold] * len(floors), [self.cache_dir] * len(floors)))
+        else:
+            keys = [_prepare_floor(f.filename, self.threshold, self.cache_dir) for f in floors]
+
+        for floor, key in zip(floors, keys):
+            engine = nav_engine.NavigationEngine(snapping_threshold=self.threshold)
+            compact = graph_cache.load_graph(floor.filename, self.threshold, self.cache_dir, key)
+            if compact is not None:
+                engine.load_compact(compact)
+            else:
+                # Cache unavailable on this platform: build in-process instead
+                engine = headless.load_engine(floor.filename, self.threshold, use_cache=False)
+            floor.engine = engine
+            floor.connectors = [name for name in engine.nodes if is_connector(name)]
+
+        self.build_overlay()
+        print(f"✓ Campus loaded: {len(floors)} floors, {len(self.overlay)} connector nodes")
+
+    def build_overlay(self):
+        """Connects each floor's connectors to each other, and each connector to the same one on the next floor up."""
+        self.overlay = {}
+        for floor in self.floors.values():
+            for c in floor.connectors:
+                self.overlay[(floor.name, c)] = {}
+
+        # Within a floor: walking distance between every pair of connectors
+        for floor in self.floors.values():
+            for c in floor.connectors:
+                for other, d in zip(floor.connectors, floor.engine.distances(c, floor.connectors)):
+                    if other != c and d < math.inf:
+                        self.overlay[(floor.name, c)][(floor.name, other)] = d
+
+        # Between floors: the same stair / lift on consecutive floors that both have it
+        shafts = {}
+        for floor in sorted(self.floors.values(), key=lambda f: f.elevation):
+            for c in floor.connectors:
+                shafts.setdefault(c, []).append(floor)
+        for c, stops in shafts.items():
+            for lower, upper in zip(stops, stops[1:]):
+                d = abs(self._elevation(upper, c) - self._elevation(lower, c))
+                self.overlay[(lower.name, c)][(upper.name, c)] = d
+                self.overlay[(upper.name, c)][(lower.name, c)] = d
+
+    def _elevation(self, floor, name):
+        return floor.elevation + floor.engine.nodes[name][2]
+
+    def route(self, source, target):
+        """Returns ([(floor, waypoint), ...], distance) between two (floor, waypoint) pairs, or None."""
+        source_floor, source_name = self._floor_of(source)
+        target_floor, target_name = self._floor_of(target)
+
+        best = None
+        if source_floor is target_floor:
+            local = source_floor.engine.shortest_path(source_name, target_name)
+            if local is not None:
+                best = ([(source_floor.name, n) for n in local[0]], local[1])
+
+        # Leave the start floor through any of its connectors, enter the
+        # destination floor through any of its, and cross on the overlay
+        start = {}
+        for c, d in zip(source_floor.connectors, source_floor.engine.distances(source_name, source_floor.connectors)):
+            if d < math.inf:
+                start[(source_floor.name, c)] = d
+        finish = {}
+        for c, d in zip(target_floor.connectors, target_floor.engine.distances(target_name, target_floor.connectors)):
+            if d < math.inf:
+                finish[(target_floor.name, c)] = d
+        if not start or not finish:
+            return best
+
+        dist, prev = self._overlay_search(start)
+        exit_node = min(finish, key=lambda n: dist.get(n, math.inf) + finish[n])
+        total = dist.get(exit_node, math.inf) + finish[exit_node]
+        if total == math.inf or (best is not None and best[1] <= total):
+            return best
+
+        hops = [exit_node]
+        while prev[hops[-1]] is not None:
+            hops.append(prev[hops[-1]])
+        hops.reverse()
+        return self._expand(source, hops, target), total
+
+    def _floor_of(self, point):
+        floor_name, name = point
+        if floor_name not in self.floors:
+            raise KeyError(f"Unknown floor '{floor_name}'")
+        floor = self.floors[floor_name]
+        if name not in floor.engine.graph:
+            raise KeyError(f"Unknown waypoint '{name}' on floor '{floor_name}'")
+        return floor, name
+
+    def _overlay_search(self, start):
+        dist = dict(start)
+        prev = {node: None for node in start}
+        heap = [(d, node) for node, d in start.items()]
+        heapq.heapify(heap)
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            for v, w in self.overlay[u].items():
+                nd = d + w
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    prev[v] = u
+                    heapq.heappush(heap, (nd, v))
+        return dist, prev
+
+    def _expand(self, source, hops, target):
+        """Turns an overlay route into the full waypoint path, walking each floor leg."""
+        path = [source]
+        stops = [source] + hops + [target]
+        for a, b in zip(stops, stops[1:]):
+            if a[0] != b[0]:
+                path.append(b)  # a stair / lift hop
+                continue
+            leg, _ = self.floors[a[0]].engine.shortest_path(a[1], b[1])
+            path.extend((a[0], n) for n in leg[1:])
+        return path
+
+
+def parse_floor(spec, index):
+    """FILE or NAME=FILE or NAME=FILE@ELEVATION; unnamed floors are named after the file."""
+    name, sep, rest = spec.partition('=')
+    if not sep:
+        name, rest = os.path.splitext(os.path.basename(spec))[0], spec
+    filename, sep, elevation = rest.rpartition('@')
+    if not sep:
+        filename, elevation = rest, index * constants.FLOOR_HEIGHT
+    return Floor(name, filename, float(elevation))
+
+
+def parse_point(spec):
+    floor, sep, name = spec.partition(':')
+    if not sep:
+        raise argparse.ArgumentTypeError(f"Expected FLOOR:WAYPOINT, got {spec!r}")
+    return floor, name
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Route across several floor plans stitched together by stairs and lifts.")
+    parser.add_argument('floors', nargs='+', help="floor DXFs as FILE, NAME=FILE or NAME=FILE@ELEVATION, lowest first")
+    parser.add_argument('--route', nargs=2, type=parse_point, action='append', default=[], metavar=('FROM', 'TO'),
+                        help="FLOOR:WAYPOINT pair to route between (repeatable)")
+    parser.add_argument('--threshold', type=float, default=constants.SNAPPING_THRESHOLD, help="snapping threshold")
+    parser.add_argument('--workers', type=int, default=None, help="parallel floor loaders")
+    args = parser.parse_args(argv)
+
+    floors = [parse_floor(spec, i) for i, spec in enumerate(args.floors)]
+    for floor in floors:
+        if not os.path.exists(floor.filename):
+            print(f"ERROR: File '{floor.filename}' not found.")
+            sys.exit(1)
+
+    campus = Campus(floors, args.threshold)
+    campus.load(args.workers)
+
+    for source, target in args.route:
+        try:
+            result = campus.route(source, target)
+        except KeyError as e:
+            print(f"ERROR: {e.args[0]}")
+            sys.exit(1)
+        label = f"{source[0]}:{source[1]} -> {target[0]}:{target[1]}"
+        if result is None:
+            print(f"{label}: no route")
+        else:
+            path, distance = result
+            print(f"{label}: {distance:.2f} ({' > '.join(f'{f}:{n}' for f, n in path)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import bisect
+from array import array
+from collections.abc import Mapping
+
+
+class CompactGraph:
+    """Frozen, array-backed navigation graph.
+
+    Node names are interned to integer ids (their index in `names`). Positions
+    live in one flat float array, x, y, z per node, and edges are stored in
+    CSR form: the neighbors of node i are neighbors[offsets[i]:offsets[i + 1]],
+    with matching weights.
+
+    A name of None marks a removed node (see NavigationEngine.update_graph):
+    its id stays reserved so cached shortest path trees keep lining up, it
+    has no edges and is absent from `ids` and the views.
+    """
+
+    def __init__(self, names, coords, offsets, neighbors, weights, ids=None):
+        self.names = names          # [ "Node_Name" or None, ... ]
+        self.coords = coords        # array('d'): x0, y0, z0, x1, y1, z1, ...
+        self.offsets = offsets      # array('q'): len(names) + 1 row starts
+        self.neighbors = neighbors  # array('i'): neighbor id per directed edge
+        self.weights = weights      # array('d'): distance per directed edge
+        if ids is None:
+            ids = {name: i for i, name in enumerate(names) if name is not None}
+        self.ids = ids              # { "Node_Name": node_id }
+
+    @classmethod
+    def empty(cls):
+        return cls([], array('d'), array('q', [0]), array('i'), array('d'))
+
+    @classmethod
+    def from_rows(cls, names, coords, rows):
+        """Freezes per-node { neighbor_id: distance } rows, keeping their order."""
+        offsets = array('q', [0])
+        neighbors = array('i')
+        weights = array('d')
+        for row in rows:
+            neighbors.extend(row.keys())
+            weights.extend(row.values())
+            offsets.append(len(neighbors))
+        return cls(list(names), array('d', coords), offsets, neighbors, weights)
+
+    def patched(self, names, coords, ids, rows):
+        """A copy with new names / coords / ids and the given { node_id: { neighbor_id: distance } } rows replaced.
+
+        Rows not in `rows` are copied over span by span; ids past the end of
+        this graph that are not in `rows` get no edges.
+        """
+        old_n = len(self)
+        offsets = array('q', [0])
+        neighbors = array('i')
+        weights = array('d')
+        done = 0  # rows [0, done) are written
+        for i in sorted(rows) + [len(names)]:
+            end = min(i, old_n)
+            if done < end:
+                lo, hi = self.offsets[done], self.offsets[end]
+                shift = len(neighbors) - lo
+                neighbors.frombytes(memoryview(self.neighbors)[lo:hi].cast('B'))
+                weights.frombytes(memoryview(self.weights)[lo:hi].cast('B'))
+                if shift:
+                    offsets.extend([o + shift for o in self.offsets[done + 1:end + 1]])
+                else:
+                    offsets.frombytes(memoryview(self.offsets)[done + 1:end + 1].cast('B'))
+                done = end
+            while done < i:  # new ids without a row of their own
+                offsets.append(len(neighbors))
+                done += 1
+            if i < len(names):
+                row = rows[i]
+                neighbors.extend(row.keys())
+                weights.extend(row.values())
+                offsets.append(len(neighbors))
+                done = i + 1
+        return CompactGraph(names, coords, offsets, neighbors, weights, ids)
+
+    def compacted(self):
+        """This graph with removed nodes squeezed out and ids renumbered (itself if there are none)."""
+        if len(self.ids) == len(self.names):
+            return self
+        new_id = array('i', [-1]) * len(self.names)
+        names = []
+        coords = array('d')
+        for i, name in enumerate(self.names):
+            if name is not None:
+                new_id[i] = len(names)
+                names.append(name)
+                coords.extend(self.position(i))
+        offsets = array('q', [0])
+        neighbors = array('i')
+        weights = array('d')
+        for i, name in enumerate(self.names):
+            if name is not None:
+                lo, hi = self.offsets[i], self.offsets[i + 1]
+                neighbors.extend([new_id[v] for v in self.neighbors[lo:hi]])
+                weights.frombytes(memoryview(self.weights)[lo:hi].cast('B'))
+                offsets.append(len(neighbors))
+        return CompactGraph(names, coords, offsets, neighbors, weights)
+
+    def __len__(self):
+        """Number of node ids, removed ones included."""
+        return len(self.names)
+
+    def edge_count(self):
+        """Number of undirected edges (each is stored once per direction)."""
+        return len(self.neighbors) // 2
+
+    def position(self, i):
+        return (self.coords[3 * i], self.coords[3 * i + 1], self.coords[3 * i + 2])
+
+    def degree(self, i):
+        return self.offsets[i + 1] - self.offsets[i]
+
+    def edges(self, i):
+        """Yields (neighbor_id, distance) for node i."""
+        for k in range(self.offsets[i], self.offsets[i + 1]):
+            yield self.neighbors[k], self.weights[k]
+
+    def edge_ends(self, k):
+        """(u, v) of directed edge k, the index of its entry in neighbors / weights."""
+        return bisect.bisect_right(self.offsets, k) - 1, self.neighbors[k]
+
+    def nbytes(self):
+        """Bytes held by the coordinate and edge arrays."""
+        return sum(a.itemsize * len(a) for a in (self.coords, self.offsets, self.neighbors, self.weights))
+
+
+class NodesView(Mapping):
+    """Read-only { "Node_Name": (x, y, z) } view over a CompactGraph."""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, name):
+        return self._graph.position(self._graph.ids[name])
+
+    def __contains__(self, name):
+        return name in self._graph.ids
+
+    def __iter__(self):
+        return iter(self._graph.ids)
+
+    def __len__(self):
+        return len(self._graph.ids)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class AdjacencyView(Mapping):
+    """Read-only { "Node_Name": { "Neighbor_Name": distance } } view over a CompactGraph."""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, name):
+        return NeighborsView(self._graph, self._graph.ids[name])
+
+    def __contains__(self, name):
+        return name in self._graph.ids
+
+    def __iter__(self):
+        return iter(self._graph.ids)
+
+    def __len__(self):
+        return len(self._graph.ids)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class NeighborsView(Mapping):
+    """Read-only { "Neighbor_Name": distance } view of one CSR row."""
+
+    def __init__(self, graph, node_id):
+        self._graph = graph
+        self._id = node_id
+
+    def __getitem__(self, name):
+        target = self._graph.ids.get(name)
+        for v, w in self._graph.edges(self._id):
+            if v == target:
+                return w
+        raise KeyError(name)
+
+    def __iter__(self):
+        names = self._graph.names
+        for v, _ in self._graph.edges(self._id):
+            yield names[v]
+
+    def __len__(self):
+        return self._graph.degree(self._id)
+
+    def __repr__(self):
+        return repr(dict(self))
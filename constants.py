@@ -8,4 +8,45 @@ GRAY = (200, 200, 200)
 LIGHT_GRAY = (240, 240, 240)
 BLUE = (100, 150, 255)
 GREEN = (100, 255, 100)
-RED = (255, 100, 100)
\ No newline at end of file
+RED = (255, 100, 100)
+
+# Layers the navigation engine reads waypoints (INSERT) and walking paths (LINE) from
+WAYPOINT_LAYER = 'Defpoints'
+TRACK_LAYER = 'trackline'
+
+# Waypoint IDs starting with these are stairs / lifts; the same ID on two floors is one shaft
+CONNECTOR_PREFIXES = ('STAIR', 'LIFT')
+# Default spacing between floors (drawing units) when a campus floor gives no elevation
+FLOOR_HEIGHT = 4000.0
+
+# Max distance (drawing units) between a trackline end and the waypoint it snaps to
+SNAPPING_THRESHOLD = 2.0
+
+# Retained rendering: cached layer surfaces bigger than this fall back to drawing every frame
+MAX_LAYER_SURFACE_PIXELS = 4_000_000
+# Room around the drawing extents on a layer surface for line widths, markers and labels
+LAYER_SURFACE_PADDING = 200
+# Culling keeps entities this far outside the drawing area, so markers and labels don't pop
+CULL_MARGIN_PIXELS = 200
+
+# Rendered text surfaces kept per font (waypoint labels, sidebar strings)
+TEXT_CACHE_SIZE = 4096
+# Grid cell (pixels) used to find overlapping waypoint labels
+LABEL_CELL_SIZE = 64
+
+# Split tracklines where they cross or meet (T-junctions, crossings, polyline bends), adding junction nodes there
+TRACK_TOPOLOGY = True
+
+# Local route service (route_service.py): default TCP port and how many answered routes it keeps
+ROUTE_SERVICE_PORT = 8765
+ROUTE_CACHE_SIZE = 4096
+
+# Landmarks for the ALT A* heuristic (landmarks.py); more bound tighter but cost a table column each
+LANDMARK_COUNT = 16
+# Landmarks consulted per A* query: the ones giving the best bound between its two ends
+ACTIVE_LANDMARKS = 4
+
+# Performance instrumentation (perf.py): on from the start, spans kept for export, frames in the overlay's window
+PERF_ENABLED = False
+PERF_MAX_SPANS = 200000
+PERF_WINDOW = 240
@@ -0,0 +1,306 @@
+import argparse
+import contextlib
+import math
+import os
+import random
+import sys
+
+import ezdxf
+
+import constants
+import dxf_loader
+import nav_engine
+
+# Randomized cross-checks of the graph algorithms that would break quietly:
+# each fast path is run against a slow, obviously right one on plans it has
+# not seen before. Any mismatch is printed with the seed and round that
+# produced it, so it can be replayed with --seed and --rounds.
+
+DEFAULT_ROUNDS = 200
+WAYPOINT_BLOCK = 'waypoint'
+
+
+class Plan:
+    """A floor plan held in an in-memory ezdxf document, edited in place between graph builds."""
+
+    def __init__(self):
+        self.doc = ezdxf.new('R2010')
+        self.doc.layers.add(constants.TRACK_LAYER)
+        self.doc.blocks.new(WAYPOINT_BLOCK).add_attdef('ID', (0, 0))
+        self.msp = self.doc.modelspace()
+
+    def waypoint(self, name, pos):
+        ref = self.msp.add_blockref(WAYPOINT_BLOCK, pos, dxfattribs={'layer': constants.WAYPOINT_LAYER})
+        ref.add_auto_attribs({'ID': name})
+        return ref
+
+    def track(self, start, end):
+        return self.msp.add_line(start, end, dxfattribs={'layer': constants.TRACK_LAYER})
+
+    def entities(self):
+        return dxf_loader.group_entities_by_layer(self.doc, [constants.WAYPOINT_LAYER, constants.TRACK_LAYER])
+
+
+def _quiet(fn, *args):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return fn(*args)
+
+
+def _random_segments(rnd):
+    """Segments (x0, y0, x1, y1) with (x0, y0) <= (x1, y1): scattered, on a grid (T-junctions, shared ends) or fanned out."""
+    kind = rnd.randrange(3)
+    segments = set()
+    for _ in range(rnd.randint(2, 60)):
+        if kind == 0:
+            x0, y0, x1, y1 = (rnd.uniform(0, 100) for _ in range(4))
+        elif kind == 1:
+            fixed = rnd.randint(0, 10) * 10.0
+            a, b = sorted(rnd.sample(range(11), 2))
+            x0, y0, x1, y1 = (a * 10.0, fixed, b * 10.0, fixed) if rnd.random() < 0.5 else (fixed, a * 10.0, fixed, b * 10.0)
+        else:
+            x0, y0 = rnd.choice((0.0, 50.0, 100.0)), rnd.choice((0.0, 50.0))
+            angle, length = rnd.uniform(0, 2 * math.pi), rnd.uniform(5, 80)
+            x1, y1 = x0 + length * math.cos(angle), y0 + length * math.sin(angle)
+        segments.add((x0, y0, x1, y1) if (x0, y0) <= (x1, y1) else (x1, y1, x0, y0))
+    return sorted(segments)
+
+
+def _collinear(a, b):
+    rx, ry = a[2] - a[0], a[3] - a[1]
+    sx, sy = b[2] - b[0], b[3] - b[1]
+    return abs(rx * sy - ry * sx) < 1e-9 and abs((b[0] - a[0]) * ry - (b[1] - a[1]) * rx) < 1e-6
+
+
+def check_sweep(rounds, seed):
+    """nav_engine._sweep_intersections against testing every pair of segments; returns the number of failures."""
+    eps = 1e-9
+    failures = 0
+    for r in range(rounds):
+        rnd = random.Random(f"sweep-{seed}-{r}")
+        segments = _random_segments(rnd)
+        found = set()
+        for _, _, through in nav_engine._sweep_intersections(segments, eps):
+            found.update((i, j) for i in through for j in through if i < j)
+        pairwise = {(i, j) for i in range(len(segments)) for j in range(i + 1, len(segments))
+                    if nav_engine._crossing(segments[i], segments[j], eps) is not None}
+        # Overlapping collinear segments meet wherever one ends on the other, which _crossing leaves out
+        extra = {(i, j) for i, j in found - pairwise if not _collinear(segments[i], segments[j])}
+        if pairwise - found or extra:
+            failures += 1
+            print(f"ERROR: sweep round {r}: {len(pairwise - found)} crossings missed, {len(extra)} extra")
+
+    # Corridors crossing in plan view at different heights must stay apart, each still walkable
+    plan = Plan()
+    for name, a, b in (('A', (0, 5, 0), (10, 5, 0)), ('B', (5, 0, constants.FLOOR_HEIGHT), (5, 10, constants.FLOOR_HEIGHT))):
+        plan.waypoint(f"{name}0", a)
+        plan.waypoint(f"{name}1", b)
+        plan.track(a, b)
+    engine = nav_engine.NavigationEngine(1.0)
+    _quiet(engine.build_graph, plan.entities())
+    if engine.shortest_path('A0', 'A1') is None or engine.shortest_path('B0', 'B1') is None \
+            or engine.shortest_path('A0', 'B0') is not None:
+        failures += 1
+        print("ERROR: sweep: corridors crossing at different heights were joined or lost")
+    return failures
+
+
+def _same_graph(a, b):
+    """Whether two engines hold the same waypoints and edges, by name, distances to rounding."""
+    if dict(a.nodes) != dict(b.nodes):
+        return False
+    for name, row in b.graph.items():
+        other = a.graph[name]
+        if other.keys() != row.keys() or any(abs(other[v] - d) > 1e-9 for v, d in row.items()):
+            return False
+    return True
+
+
+def _same_trees(engine, reference, sources):
+    for source in sources:
+        got, _ = engine.shortest_path_tree(source)
+        want, _ = reference.shortest_path_tree(source)
+        if got.keys() != want.keys() or any(abs(got[v] - d) > 1e-6 for v, d in want.items()):
+            return False
+    return True
+
+
+def _edit(plan, rnd, waypoints, tracks, spots, serial):
+    """One random edit to the plan: a waypoint or track line added, removed or moved."""
+    op = rnd.randrange(6)
+    if op == 0 and waypoints:
+        ref = rnd.choice(waypoints)
+        ref.dxf.insert = rnd.choice(spots) if rnd.random() < 0.5 else (rnd.uniform(0, 60), rnd.uniform(0, 60), 0.0)
+    elif op == 1 and waypoints:
+        ref = waypoints.pop(rnd.randrange(len(waypoints)))
+        plan.msp.delete_entity(ref)
+    elif op == 2:
+        # Often right on top of another waypoint, where snapping has to break a tie
+        waypoints.append(plan.waypoint(f"W{serial}", rnd.choice(spots)))
+    elif op == 3 and tracks:
+        plan.msp.delete_entity(tracks.pop(rnd.randrange(len(tracks))))
+    elif op == 4:
+        tracks.append(plan.track(rnd.choice(spots), rnd.choice(spots)))
+    elif tracks:
+        line = rnd.choice(tracks)
+        line.dxf.end = rnd.choice(spots)
+
+
+def check_patch(rounds, seed):
+    """NavigationEngine.update_graph against build_graph after random edits, cached trees included; returns the number of failures."""
+    failures = 0
+    for r in range(rounds):
+        rnd = random.Random(f"patch-{seed}-{r}")
+        topology = r % 2 == 0
+        spots = [(x * 10.0, y * 10.0, 0.0) for x in range(7) for y in range(7)]
+        plan = Plan()
+        waypoints = [plan.waypoint(f"P{n}", spot) for n, spot in enumerate(rnd.sample(spots, 25))]
+        tracks = [plan.track(rnd.choice(spots), rnd.choice(spots)) for _ in range(40)]
+        engine = nav_engine.NavigationEngine(1.0, track_changes=True, topology=topology)
+        _quiet(engine.build_graph, plan.entities())
+
+        for step in range(5):
+            names = sorted(engine.nodes)
+            sources = rnd.sample(names, min(3, len(names)))
+            for source in sources:
+                engine.shortest_path_tree(source)
+            for n in range(rnd.randint(1, 3)):
+                _edit(plan, rnd, waypoints, tracks, spots, f"{r}_{step}_{n}")
+            entities = plan.entities()
+            _quiet(engine.update_graph, entities)
+            reference = nav_engine.NavigationEngine(1.0, topology=topology)
+            _quiet(reference.build_graph, entities)
+            sources = [source for source in sources if source in reference.nodes]
+            if not _same_graph(engine, reference) or not _same_trees(engine, reference, sources):
+                failures += 1
+                print(f"ERROR: patch round {r} step {step}: the patched graph differs from a rebuild")
+                break
+
+    # A corridor crossed every 0.9 (under the threshold) gets a junction at
+    # every other crossing; a new crossing at one end shifts all of them, far
+    # past the edit, and each crossing corridor has to be cut again
+    plan = Plan()
+    plan.track((-20, 0, 0), (40, 0, 0))
+    for k in range(30):
+        plan.track((k * 0.9, -5, 0), (k * 0.9, 5, 0))
+    engine = nav_engine.NavigationEngine(1.0, track_changes=True, topology=True)
+    _quiet(engine.build_graph, plan.entities())
+    plan.track((-0.5, -5, 0), (-0.5, 5, 0))
+    entities = plan.entities()
+    _quiet(engine.update_graph, entities)
+    reference = nav_engine.NavigationEngine(1.0, topology=True)
+    _quiet(reference.build_graph, entities)
+    if not _same_graph(engine, reference):
+        failures += 1
+        print("ERROR: patch: junctions shifted along a corridor differ from a rebuild")
+    return failures
+
+
+def _path_cost(engine, path):
+    """What walking `path` costs on the engine's current (runtime-adjusted) weights."""
+    g = engine.compact
+    cost = 0.0
+    for a, b in zip(path, path[1:]):
+        u, v = g.ids[a], g.ids[b]
+        cost += next(engine.weights[k] for k in range(g.offsets[u], g.offsets[u + 1]) if g.neighbors[k] == v)
+    return cost
+
+
+def _change(engine, rnd):
+    """One random runtime change: an edge or waypoint closed or reopened, or an edge made dearer, cheaper or restored."""
+    g = engine.compact
+    edges = [(g.names[u], g.names[v]) for u in range(len(g)) for v, _ in g.edges(u) if u < v]
+    # Changes outlive plan edits, but only those on edges and waypoints still there can be undone one by one
+    present = {tuple(sorted(pair)) for pair in edges}
+    closed_edges = sorted(present & engine._closed_edges)
+    closed_nodes = sorted(name for name in engine._closed_nodes if name in engine.nodes)
+    overrides = sorted(present & engine._overrides.keys())
+    op = rnd.random()
+    if op < 0.15 and closed_edges:
+        engine.unblock_edge(*rnd.choice(closed_edges))
+    elif op < 0.25 and closed_nodes:
+        engine.unblock_node(rnd.choice(closed_nodes))
+    elif op < 0.35 and overrides:
+        engine.set_edge_weight(*rnd.choice(overrides), None)
+    elif not edges:
+        return
+    elif op < 0.55:
+        engine.block_edge(*rnd.choice(edges))
+    elif op < 0.65:
+        engine.block_node(rnd.choice(rnd.choice(edges)))
+    else:
+        a, b = rnd.choice(edges)
+        engine.set_edge_weight(a, b, engine.graph[a][b] * rnd.choice((0.0, 0.3, 0.9, 2.0, 10.0)))
+
+
+def check_repair(rounds, seed):
+    """Shortest path trees repaired after runtime changes (and plan edits) against trees grown afresh; returns the number of failures."""
+    failures = 0
+    for r in range(rounds):
+        rnd = random.Random(f"repair-{seed}-{r}")
+        spots = [(x * 10.0 + rnd.uniform(-2, 2), y * 10.0 + rnd.uniform(-2, 2), 0.0) for x in range(7) for y in range(7)]
+        plan = Plan()
+        waypoints = [plan.waypoint(f"P{n}", spot) for n, spot in enumerate(spots)]
+        tracks = [plan.track(a, b) for a in spots for b in spots
+                  if a < b and math.dist(a, b) < 15 and rnd.random() < 0.8]
+        engine = nav_engine.NavigationEngine(1.0, track_changes=True)
+        _quiet(engine.build_graph, plan.entities())
+        sources = rnd.sample(sorted(engine.nodes), 4)
+        for source in sources:
+            engine.shortest_path_tree(source)
+
+        for step in range(10):
+            if rnd.random() < 0.2:
+                _edit(plan, rnd, waypoints, tracks, spots, f"{r}_{step}")
+                _quiet(engine.update_graph, plan.entities())
+            else:
+                _quiet(_change, engine, rnd)
+            reference = nav_engine.NavigationEngine(1.0)
+            _quiet(reference.build_graph, plan.entities())
+            _quiet(reference.set_dynamic_state, engine.dynamic_state())
+
+            live = [source for source in sources if source in engine.nodes]
+            ok = _same_trees(engine, reference, live)
+            names = sorted(engine.nodes)
+            for _ in range(5):
+                source, target = rnd.choice(live or names), rnd.choice(names)
+                distances, _ = reference.shortest_path_tree(source)
+                # From a cached tree where there is one, else A* with the scaled heuristic
+                route = engine.shortest_path(source, target)
+                if route is None:
+                    ok = ok and target not in distances
+                else:
+                    path, distance = route
+                    ok = ok and target in distances and abs(distance - distances[target]) < 1e-6 \
+                        and abs(_path_cost(engine, path) - distance) < 1e-6
+            if not ok:
+                failures += 1
+                print(f"ERROR: repair round {r} step {step}: routes differ from searches on fresh trees")
+                break
+    return failures
+
+
+CHECKS = {'sweep': check_sweep, 'patch': check_patch, 'repair': check_repair}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cross-check the graph algorithms against slow reference versions on random plans.")
+    parser.add_argument('--check', choices=sorted(CHECKS), action='append',
+                        help="run only this check; may be given more than once (default: all)")
+    parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS, help="random plans per check")
+    parser.add_argument('--seed', type=int, default=0, help="random seed")
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for name in args.check or CHECKS:
+        failures = CHECKS[name](args.rounds, args.seed)
+        if failures:
+            print(f"ERROR: {name}: {failures} mismatches")
+            failed += 1
+        else:
+            print(f"✓ {name}: {args.rounds} rounds agree")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import ezdxf
+from ezdxf.addons import iterdxf
+
+import constants
+import perf
+
+# Entity types build_graph reads from the navigation layers
+NAVIGATION_TYPES = ('INSERT', 'LINE', 'LWPOLYLINE', 'POLYLINE')
+
+
+def load_dxf(filename):
+    """Reads a DXF document. Raises IOError / ezdxf.DXFStructureError like ezdxf.readfile."""
+    with perf.span('load_dxf'):
+        return ezdxf.readfile(filename)
+
+
+def get_layer_names(doc):
+    return [layer.dxf.name for layer in doc.layers]
+
+
+def entity_bounds(entity):
+    """Returns (min_x, min_y, max_x, max_y) of an entity, or None for types that are not measured."""
+    dxftype = entity.dxftype()
+    if dxftype == 'LINE':
+        start, end = entity.dxf.start, entity.dxf.end
+        return (min(start[0], end[0]), min(start[1], end[1]), max(start[0], end[0]), max(start[1], end[1]))
+    elif dxftype in ('CIRCLE', 'ARC'):
+        cx, cy = entity.dxf.center[0], entity.dxf.center[1]
+        r = entity.dxf.radius
+        return (cx - r, cy - r, cx + r, cy + r)
+    elif dxftype in ('LWPOLYLINE', 'POLYLINE'):
+        xs, ys = [], []
+        for point in entity.get_points():
+            xs.append(point[0])
+            ys.append(point[1])
+        if not xs:
+            return None
+        return (min(xs), min(ys), max(xs), max(ys))
+    elif dxftype == 'SPLINE':
+        points = list(entity.control_points) or list(entity.fit_points)
+        if not points:
+            return None
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        return (min(xs), min(ys), max(xs), max(ys))
+    elif dxftype == 'INSERT':
+        # to make sure that the waypoints are included in the extents
+        pos = entity.dxf.insert
+        return (pos[0], pos[1], pos[0], pos[1])
+    return None
+
+
+def scan_entities(entities, layers=(), keep_layers=None):
+    """Groups entities by layer and measures the drawing extents in a single pass.
+
+    Returns (entities_by_layer, extents, measured_count). entities_by_layer has an
+    entry for every name in `layers` even if it stays empty; extents is
+    (min_x, min_y, max_x, max_y), or None when nothing could be measured. When
+    keep_layers is given, entities on any other layer are dropped as they stream past.
+    """
+    with perf.span('group_entities') as span:
+        entities_by_layer = {layer: [] for layer in layers}
+        min_x, min_y, max_x, max_y = float('inf'), float('inf'), float('-inf'), float('-inf')
+        measured_count = 0
+
+        for entity in entities:
+            layer_name = entity.dxf.layer
+            if keep_layers is not None and layer_name not in keep_layers:
+                continue
+            if layer_name not in entities_by_layer:
+                entities_by_layer[layer_name] = []
+            entities_by_layer[layer_name].append(entity)
+
+            try:
+                bounds = entity_bounds(entity)
+            except Exception:
+                bounds = None
+            if bounds is not None:
+                min_x, min_y = min(min_x, bounds[0]), min(min_y, bounds[1])
+                max_x, max_y = max(max_x, bounds[2]), max(max_y, bounds[3])
+                measured_count += 1
+        span.set(entities=sum(len(e) for e in entities_by_layer.values()))
+
+    extents = (min_x, min_y, max_x, max_y) if measured_count else None
+    return entities_by_layer, extents, measured_count
+
+
+def group_entities_by_layer(doc, layers=None):
+    """Returns { "Layer_Name": [entity, ...] } for the modelspace, with an entry for every known layer."""
+    if layers is None:
+        layers = get_layer_names(doc)
+    entities_by_layer, _, _ = scan_entities(doc.modelspace(), layers)
+    return entities_by_layer
+
+
+def load_entities(filename):
+    """Reads a DXF and groups its modelspace by layer in one call."""
+    return group_entities_by_layer(load_dxf(filename))
+
+
+def stream_entities(filename, layers=(constants.WAYPOINT_LAYER, constants.TRACK_LAYER), types=NAVIGATION_TYPES):
+    """Streams the ENTITIES section with iterdxf, keeping only `types` on `layers`.
+
+    The document is never loaded as a whole: header, tables, blocks and objects
+    are skipped, entities of other types are never parsed, and entities on other
+    layers are dropped as they stream past, so memory is bounded by what is kept.
+    Needs a seekable ASCII DXF. Returns { "Layer_Name": [entity, ...] }.
+    """
+    with perf.span('stream_entities'):
+        entities_by_layer, _, _ = scan_entities(iterdxf.modelspace(filename, types=types), layers, keep_layers=set(layers))
+    return entities_by_layer
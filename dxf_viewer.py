@@ -1,30 +1,47 @@
 import pygame
 import ezdxf
+import hashlib
 import sys
 import os
 from random import random
 from typing import List, Dict, Set
 import colorsys
 import constants
+import dxf_loader
+import geometry
+import graph_cache
+import perf
+from text_cache import TextCache, LabelPlacer
 
-# Initialize pygame
-pygame.init()
+# Packed drawings are cached beside the graph cache, so a warm start never parses the DXF
+VIEW_CACHE_SUFFIX = '.navview.npz'
 
 class DXFViewer:
-    def __init__(self, filename: str):
+    def __init__(self, filename: str, use_cache=True, cache_dir=None):
         self.filename = filename
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
         self.doc = None
         self.layers = []
         self.selected_layers = set()
         self.entities_by_layer = {}
+        self.extents = None  # (min_x, min_y, max_x, max_y), measured while grouping
+        self.geometry = {}  # { "Layer_Name": LayerGeometry }, packed once after grouping
+        self.layer_counts = {}  # { "Layer_Name": entity count }, kept after the entities are released
+
+        # Retained rendering: each layer is rasterized once per scale and re-blitted when panning
+        self.retained = True
+        self.layer_surfaces = {}  # { "Layer_Name": (surface, offset_x, offset_y) or None }
+        self.raster_scale = None
         self.layer_colors = {}  # Store unique color for each layer
 
-        # Pygame setup
-        self.screen = pygame.display.set_mode((constants.SCREEN_WIDTH, constants.SCREEN_HEIGHT))
-        pygame.display.set_caption(f"DXF Viewer - {os.path.basename(filename)}")
-        self.clock = pygame.time.Clock()
-        self.font = pygame.font.Font(None, 24)
-        self.small_font = pygame.font.Font(None, 20)
+        # Pygame setup happens in open_window(), so loading a file needs no display
+        self.screen = None
+        self.clock = None
+        self.font = None
+        self.small_font = None
+        self.text = None  # TextCache per font, so labels and sidebar strings render once
+        self.small_text = None
 
         # View transformation
         self.offset_x = 0
@@ -33,6 +50,11 @@ class DXFViewer:
         self.dragging = False
         self.last_mouse_pos = (0, 0)
 
+        # Performance overlay (F3); it switches instrumentation on while shown
+        self.show_perf = False
+        self.perf_was_enabled = False
+        self.last_draw_counts = (0, 0, 0)  # draw.drawn / draw.culled / draw.rasterized counters after the previous frame
+
         # Checkbox parameters
         self.checkbox_size = 20
         self.checkbox_padding = 10
@@ -40,6 +62,17 @@ class DXFViewer:
 
         self.load_file()
 
+    def open_window(self):
+        """Initialise pygame and create the window (called by run())"""
+        pygame.init()
+        self.screen = pygame.display.set_mode((constants.SCREEN_WIDTH, constants.SCREEN_HEIGHT))
+        pygame.display.set_caption(f"DXF Viewer - {os.path.basename(self.filename)}")
+        self.clock = pygame.time.Clock()
+        self.font = pygame.font.Font(None, 24)
+        self.small_font = pygame.font.Font(None, 20)
+        self.text = TextCache(self.font)
+        self.small_text = TextCache(self.small_font)
+
     def get_layer_colours(self, n):
         BLUE = (100, 150, 255)
         GREEN = (100, 255, 100)
@@ -56,26 +89,35 @@ class DXFViewer:
 
         return colors
 
+    def set_layers(self, layers):
+        """Take the drawing's layer names, giving each a colour and selecting them all"""
+        self.layers = layers
+        print(f"✓ Found {len(self.layers)} layers: {self.layers}")
+
+        # Get colours for each layer, throw error if more than 3 layers 
+        if(len(self.layers)>10):
+            print("Cannot have more than 3 layers. Make sure its the right file")
+            quit()
+        distinct_colors = self.get_layer_colours(len(self.layers))
+        self.layer_colors = {layer: color for layer, color in zip(self.layers, distinct_colors)}
+
+        # Select all layers by default
+        self.selected_layers = set(self.layers)
+
     def load_file(self):
-        """Load DXF file"""
+        """Load DXF file, or its packed drawing from the view cache if the file is unchanged"""
         try:
+            view_path = self.view_cache_path() if self.use_cache else None
+            if view_path is not None and self.load_cached_view(view_path):
+                self.auto_fit_view()
+                return
+
             print("Loading DXF file...")
-            self.doc = ezdxf.readfile(self.filename)
+            self.doc = dxf_loader.load_dxf(self.filename)
             print("✓ DXF loaded successfully")
 
             # Extract layers
-            self.layers = [layer.dxf.name for layer in self.doc.layers]
-            print(f"✓ Found {len(self.layers)} layers: {self.layers}")
-
-            # Get colours for each layer, throw error if more than 3 layers 
-            if(len(self.layers)>10):
-                print("Cannot have more than 3 layers. Make sure its the right file")
-                quit()
-            distinct_colors = self.get_layer_colours(len(self.layers))
-            self.layer_colors = {layer: color for layer, color in zip(self.layers, distinct_colors)}
-
-            # Select all layers by default
-            self.selected_layers = set(self.layers)
+            self.set_layers(dxf_loader.get_layer_names(self.doc))
 
             # Group entities by layer
             self.group_entities_by_layer()
@@ -83,6 +125,9 @@ class DXFViewer:
             # Auto-fit view
             self.auto_fit_view()
 
+            if view_path is not None:
+                self.save_cached_view(view_path)
+
         except IOError:
             print(f"ERROR: Cannot read file '{self.filename}'")
             sys.exit(1)
@@ -93,69 +138,51 @@ class DXFViewer:
             print(f"ERROR: {e}")
             sys.exit(3)
 
-    def group_entities_by_layer(self):
-        msp = self.doc.modelspace()
-
-        for layer in self.layers:
-            self.entities_by_layer[layer] = []
+    def view_cache_path(self):
+        """Where the packed drawing of the DXF as it is now is cached"""
+        key = f"{geometry.CACHE_FORMAT_VERSION}:{geometry.SPLINE_FLATTENING!r}:{graph_cache.content_digest(self.filename)}"
+        return graph_cache.cache_path(self.filename, hashlib.sha256(key.encode('utf-8')).digest(),
+                                      self.cache_dir, VIEW_CACHE_SUFFIX)
+
+    def load_cached_view(self, path):
+        """Take the layers, entity counts, extents and packed geometry from the view cache; True on a hit"""
+        cached = geometry.load_geometry(path)
+        if cached is None:
+            return False
+        self.geometry, meta = cached
+        self.layer_counts = meta['layer_counts']
+        self.extents = tuple(meta['extents']) if meta['extents'] is not None else None
+        print(f"✓ Drawing loaded from cache: {sum(self.layer_counts.values())} entities")
+        self.set_layers(meta['layers'])
+        return True
+
+    def save_cached_view(self, path):
+        meta = {'layers': self.layers, 'layer_counts': self.layer_counts,
+                'extents': list(self.extents) if self.extents is not None else None}
+        try:
+            graph_cache.write_file(self.filename, path, lambda f: geometry.save_geometry(f, self.geometry, meta),
+                                   VIEW_CACHE_SUFFIX)
+        except OSError as e:
+            print(f"WARNING: Drawing not cached: {e}")
 
-        # Iterate through all entities and group by layer
-        for entity in msp:
-            layer_name = entity.dxf.layer
-            if layer_name not in self.entities_by_layer:
-                self.entities_by_layer[layer_name] = []
-            self.entities_by_layer[layer_name].append(entity)
+    def group_entities_by_layer(self):
+        # One pass over the modelspace groups entities and measures the extents
+        self.entities_by_layer, self.extents, entity_count = dxf_loader.scan_entities(
+            self.doc.modelspace(), self.layers)
 
         for layer, entities in self.entities_by_layer.items():
             if len(entities) > 0:
                 print(f"  Layer '{layer}': {len(entities)} entities")
-
-    def auto_fit_view(self):
-        #Calculate optimal scale and offset to fit all entities
-        min_x, min_y, max_x, max_y = float('inf'), float('inf'), float('-inf'), float('-inf')
-
-        msp = self.doc.modelspace()
-        entity_count = 0
-
-        for entity in msp:
-            try:
-                if entity.dxftype() == 'LINE':
-                    min_x = min(min_x, entity.dxf.start[0], entity.dxf.end[0])
-                    max_x = max(max_x, entity.dxf.start[0], entity.dxf.end[0])
-                    min_y = min(min_y, entity.dxf.start[1], entity.dxf.end[1])
-                    max_y = max(max_y, entity.dxf.start[1], entity.dxf.end[1])
-                    entity_count += 1
-                elif entity.dxftype() == 'CIRCLE':
-                    cx, cy = entity.dxf.center[0], entity.dxf.center[1]
-                    r = entity.dxf.radius
-                    min_x, max_x = min(min_x, cx-r), max(max_x, cx+r)
-                    min_y, max_y = min(min_y, cy-r), max(max_y, cy+r)
-                    entity_count += 1
-                elif entity.dxftype() == 'ARC':
-                    cx, cy = entity.dxf.center[0], entity.dxf.center[1]
-                    r = entity.dxf.radius
-                    min_x, max_x = min(min_x, cx-r), max(max_x, cx+r)
-                    min_y, max_y = min(min_y, cy-r), max(max_y, cy+r)
-                    entity_count += 1
-                elif entity.dxftype() in ['LWPOLYLINE', 'POLYLINE']:
-                    for point in entity.get_points():
-                        min_x = min(min_x, point[0])
-                        max_x = max(max_x, point[0])
-                        min_y = min(min_y, point[1])
-                        max_y = max(max_y, point[1])
-                    entity_count += 1
-                    #to make sure that the waypoints are included in the calculation
-                elif entity.dxftype() == 'INSERT': 
-                    pos = entity.dxf.insert
-                    min_x, max_x = min(min_x, pos[0]), max(max_x, pos[0])
-                    min_y, max_y = min(min_y, pos[1]), max(max_y, pos[1])
-                    entity_count += 1
-            except:
-                pass
-
         print(f"✓ Processed {entity_count} entities for display")
 
-        if min_x != float('inf'):
+        self.layer_counts = {layer: len(entities) for layer, entities in self.entities_by_layer.items()}
+        self.geometry = geometry.build_geometry(self.entities_by_layer)
+
+    @perf.timed('auto_fit_view')
+    def auto_fit_view(self):
+        #Calculate optimal scale and offset to fit all entities, from the extents cached at load
+        if self.extents is not None:
+            min_x, min_y, max_x, max_y = self.extents
             drawing_width = max_x - min_x
             drawing_height = max_y - min_y
 
@@ -177,73 +204,132 @@ class DXFViewer:
         screen_y = -y * self.scale + self.offset_y
         return int(screen_x), int(screen_y)
 
-    def get_entity_color(self, entity):
-        """Get color for entity based on its layer"""
-        layer_name = entity.dxf.layer
-        return self.layer_colors.get(layer_name, constants.WHITE)
-
-    def draw_entity(self, entity):
-        """Draw a single entity"""
-        if entity.dxf.layer not in self.selected_layers:
-            return
-
-        color = self.get_entity_color(entity)
-
-        try:
-            if entity.dxftype() == 'LINE':
-                start = self.world_to_screen(entity.dxf.start[0], entity.dxf.start[1])
-                end = self.world_to_screen(entity.dxf.end[0], entity.dxf.end[1])
-                pygame.draw.line(self.screen, color, start, end, 2)  # Thicker lines
-
-            elif entity.dxftype() == 'CIRCLE':
-                center = self.world_to_screen(entity.dxf.center[0], entity.dxf.center[1])
-                radius = int(entity.dxf.radius * self.scale)
-                if radius > 0:
-                    pygame.draw.circle(self.screen, color, center, radius, 2)
-
-            elif entity.dxftype() == 'ARC':
-                center = self.world_to_screen(entity.dxf.center[0], entity.dxf.center[1])
-                radius = int(entity.dxf.radius * self.scale)
-                if radius > 0:
-                    pygame.draw.circle(self.screen, color, center, radius, 2)
-
-            elif entity.dxftype() == 'LWPOLYLINE' or entity.dxftype() == 'POLYLINE':
-                points = [self.world_to_screen(p[0], p[1]) for p in entity.get_points()]
-                if len(points) > 1:
-                    pygame.draw.lines(self.screen, color, entity.is_closed, points, 2)
-
-            elif entity.dxftype() == 'SPLINE':
-                try:
-                    points = [self.world_to_screen(p[0], p[1]) for p in entity.flattening(0.1)]
-                    if len(points) > 1:
-                        pygame.draw.lines(self.screen, color, False, points, 2)
-                except:
-                    pass
-
-            elif entity.dxftype() == 'INSERT':
-                # Convert CAD coordinates to screen pixels
-                pos = self.world_to_screen(entity.dxf.insert[0], entity.dxf.insert[1])
-                
-                # Draw a visual marker (a filled circle) for the waypoint
-                pygame.draw.circle(self.screen, color, pos, 6) # slightly larger than lines
-                
-                # Extract and display the attribute text (e.g., "Node_A")
-                for attrib in entity.attribs:
-                    if attrib.dxf.tag in ['ID', 'NAME']:
-                        text_surface = self.small_font.render(attrib.dxf.text, True, constants.WHITE)
-                        self.screen.blit(text_surface, (pos[0] + 10, pos[1] - 10))
-        except Exception as e:
-            pass
+    def visible_world_rect(self):
+        """World-space (min_x, min_y, max_x, max_y) of the drawing area, widened for markers and labels"""
+        margin = constants.CULL_MARGIN_PIXELS
+        min_x = (-margin - self.offset_x) / self.scale
+        max_x = (constants.DRAWING_AREA_WIDTH + margin - self.offset_x) / self.scale
+        min_y = (self.offset_y - constants.SCREEN_HEIGHT - margin) / self.scale
+        max_y = (self.offset_y + margin) / self.scale
+        return min_x, min_y, max_x, max_y
+
+    def draw_geometry(self, layer, surface, offset_x, offset_y, world_rect=None):
+        """Draw one layer's packed geometry, culled to world_rect and thinned by level of detail; returns the DrawList"""
+        geom = self.geometry.get(layer)
+        if geom is None:
+            return None
+        color = self.layer_colors.get(layer, constants.WHITE)
+        frame = geom.draw_list(self.scale, offset_x, offset_y, world_rect)
+
+        it = iter(frame.segments)
+        for x1, y1, x2, y2 in zip(it, it, it, it):
+            pygame.draw.line(surface, color, (x1, y1), (x2, y2), 2)  # Thicker lines
+
+        starts = frame.polyline_starts
+        for k, closed in enumerate(frame.polyline_closed):
+            pygame.draw.lines(surface, color, closed, frame.polylines[starts[k]:starts[k + 1]], 2)
+
+        it = iter(frame.circles)
+        for x, y, radius in zip(it, it, frame.radii):
+            pygame.draw.circle(surface, color, (x, y), radius, 2)
+
+        it = iter(frame.dots)
+        for x, y in zip(it, it):
+            surface.fill(color, (x, y, 2, 2))
+
+        # Labels that would overlap one already drawn are skipped (mostly when zoomed out)
+        placer = LabelPlacer()
+        it = iter(frame.markers)
+        for x, y, texts in zip(it, it, frame.labels):
+            # Draw a visual marker (a filled circle) for the waypoint
+            pygame.draw.circle(surface, color, (x, y), 6) # slightly larger than lines
+            for text in texts:
+                if not text or placer.blocked(x + 10, y - 10):
+                    continue
+                width, height = self.small_text.size(text, constants.WHITE)
+                if placer.place(pygame.Rect(x + 10, y - 10, width, height)):
+                    surface.blit(self.small_text.render(text, constants.WHITE), (x + 10, y - 10))
+        return frame
     
     def get_entities(self):
+        if self.doc is None and not self.entities_by_layer:
+            # Drawn from the view cache: read just the navigation layers now
+            return dxf_loader.stream_entities(self.filename)
         return self.entities_by_layer
 
+    def release_entities(self):
+        """Drop the ezdxf document and entities; drawing only needs the packed geometry"""
+        self.doc = None
+        self.entities_by_layer = {}
+
+    def invalidate_layer_surfaces(self):
+        """Drop all cached layer surfaces (they are rebuilt on the next frame)"""
+        self.layer_surfaces.clear()
+        self.raster_scale = None
+
+    def get_layer_surface(self, layer):
+        """Cached (surface, offset_x, offset_y) for a layer at the current scale, or None if too large"""
+        if self.raster_scale != self.scale:
+            self.invalidate_layer_surfaces()
+            self.raster_scale = self.scale
+        if layer not in self.layer_surfaces:
+            self.layer_surfaces[layer] = self.rasterize_layer(layer)
+        return self.layer_surfaces[layer]
+
+    @perf.timed('frame.rasterize')
+    def rasterize_layer(self, layer):
+        """Draw every entity of a layer once onto an off-screen surface covering the whole drawing"""
+        if self.extents is None:
+            return None
+        min_x, min_y, max_x, max_y = self.extents
+        pad = constants.LAYER_SURFACE_PADDING
+        width = int((max_x - min_x) * self.scale) + 2 * pad
+        height = int((max_y - min_y) * self.scale) + 2 * pad
+        if width * height > constants.MAX_LAYER_SURFACE_PIXELS:
+            return None
+
+        surface = pygame.Surface((width, height)).convert()
+        surface.fill(constants.BLACK)
+        surface.set_colorkey(constants.BLACK, pygame.RLEACCEL)
+
+        # Draw with a view transform that maps the drawing's top-left corner to (pad, pad)
+        raster_offset_x = pad - min_x * self.scale
+        raster_offset_y = pad + max_y * self.scale
+        # Keep the view's sub-pixel phase, so blitting at whole-pixel pan offsets
+        # lands every pixel where drawing directly would have
+        raster_offset_x += (self.offset_x - raster_offset_x) % 1
+        raster_offset_y += (self.offset_y - raster_offset_y) % 1
+        frame = self.draw_geometry(layer, surface, raster_offset_x, raster_offset_y)
+        if frame is not None:
+            perf.count('draw.rasterized', frame.drawn)
+
+        return surface, raster_offset_x, raster_offset_y
+
+    def draw_layers(self):
+        """Draw the selected layers, re-blitting cached layer surfaces where possible"""
+        for layer in self.selected_layers:
+            cached = self.get_layer_surface(layer) if self.retained else None
+            if cached is None:
+                frame = self.draw_geometry(layer, self.screen, self.offset_x, self.offset_y, self.visible_world_rect())
+                if frame is not None:
+                    perf.count('draw.drawn', frame.drawn)
+                    perf.count('draw.culled', frame.culled)
+            else:
+                surface, raster_offset_x, raster_offset_y = cached
+                self.screen.blit(surface, (round(self.offset_x - raster_offset_x), round(self.offset_y - raster_offset_y)))
+                geom = self.geometry.get(layer)
+                if perf.enabled and geom is not None:
+                    # What the blit put on screen, counted like drawing it directly would
+                    visible = len(geom.index.query(*self.visible_world_rect()))
+                    perf.count('draw.drawn', visible)
+                    perf.count('draw.culled', len(geom) - visible)
+
     def draw_sidebar(self):
         """Draw the layer selection sidebar"""
         pygame.draw.rect(self.screen, constants.LIGHT_GRAY, 
                         (constants.DRAWING_AREA_WIDTH, 0, constants.SIDEBAR_WIDTH, constants.SCREEN_HEIGHT))
 
-        title = self.font.render("Layers", True, constants.BLACK)
+        title = self.text.render("Layers", constants.BLACK)
         self.screen.blit(title, (constants.DRAWING_AREA_WIDTH + 10, 10))
 
         select_all_rect = pygame.Rect(constants.DRAWING_AREA_WIDTH + 10, 40, 130, 30)
@@ -252,8 +338,8 @@ class DXFViewer:
         pygame.draw.rect(self.screen, constants.GREEN, select_all_rect)
         pygame.draw.rect(self.screen, constants.RED, deselect_all_rect)
 
-        select_text = self.small_font.render("Select All", True, constants.BLACK)
-        deselect_text = self.small_font.render("Deselect All", True, constants.BLACK)
+        select_text = self.small_text.render("Select All", constants.BLACK)
+        deselect_text = self.small_text.render("Deselect All", constants.BLACK)
         self.screen.blit(select_text, (select_all_rect.x + 20, select_all_rect.y + 7))
         self.screen.blit(deselect_text, (deselect_all_rect.x + 15, deselect_all_rect.y + 7))
 
@@ -289,26 +375,25 @@ class DXFViewer:
                                (checkbox_rect.x + 17, checkbox_rect.y + 5), 3)
 
             # Draw layer name and entity count
-            entity_count = len(self.entities_by_layer.get(layer, []))
-            layer_text = self.small_font.render(
-                f"{layer} ({entity_count})", 
-                True, constants.BLACK
-            )
+            entity_count = self.layer_counts.get(layer, 0)
+            layer_text = self.small_text.render(f"{layer} ({entity_count})", constants.BLACK)
             self.screen.blit(layer_text, 
                            (checkbox_rect.x + self.checkbox_size + 10, y_offset))
 
             y_offset += 30
 
         # Instructions
-        inst_y = constants.SCREEN_HEIGHT - 100
-        inst1 = self.small_font.render("Mouse: Pan (drag)", True, constants.BLACK)
-        inst2 = self.small_font.render("Wheel: Zoom", True, constants.BLACK)
-        inst3 = self.small_font.render("R: Reset view", True, constants.BLACK)
-        inst4 = self.small_font.render("ESC: Exit", True, constants.BLACK)
+        inst_y = constants.SCREEN_HEIGHT - 120
+        inst1 = self.small_text.render("Mouse: Pan (drag)", constants.BLACK)
+        inst2 = self.small_text.render("Wheel: Zoom", constants.BLACK)
+        inst3 = self.small_text.render("R: Reset view", constants.BLACK)
+        inst4 = self.small_text.render("F3: Performance", constants.BLACK)
+        inst5 = self.small_text.render("ESC: Exit", constants.BLACK)
         self.screen.blit(inst1, (constants.DRAWING_AREA_WIDTH + 10, inst_y))
         self.screen.blit(inst2, (constants.DRAWING_AREA_WIDTH + 10, inst_y + 20))
         self.screen.blit(inst3, (constants.DRAWING_AREA_WIDTH + 10, inst_y + 40))
         self.screen.blit(inst4, (constants.DRAWING_AREA_WIDTH + 10, inst_y + 60))
+        self.screen.blit(inst5, (constants.DRAWING_AREA_WIDTH + 10, inst_y + 80))
 
     def handle_click(self, pos):
         """Handle mouse click events"""
@@ -347,12 +432,78 @@ class DXFViewer:
 
                 y_offset += 30
 
+    def draw_frame(self):
+        """Draw the selected layers and the sidebar, and show them"""
+        with perf.span('frame'):
+            with perf.span('frame.clear'):
+                self.screen.fill(constants.BLACK)
+            with perf.span('frame.layers'):
+                self.draw_layers()
+            with perf.span('frame.sidebar'):
+                self.draw_sidebar()
+            if self.show_perf:
+                with perf.span('frame.overlay'):
+                    self.draw_perf_overlay()
+            with perf.span('frame.flip'):
+                pygame.display.flip()
+
+    def toggle_perf_overlay(self):
+        """Show or hide the performance overlay, switching instrumentation on for as long as it is shown"""
+        self.show_perf = not self.show_perf
+        if self.show_perf:
+            self.perf_was_enabled = perf.enabled
+            perf.enable()
+            self.last_draw_counts = (perf.counters['draw.drawn'], perf.counters['draw.culled'], perf.counters['draw.rasterized'])
+        elif not self.perf_was_enabled:
+            perf.disable()
+
+    def draw_perf_overlay(self):
+        """Frame time percentiles, entities on screen / culled / rasterized last frame and the mean cost of each draw phase"""
+        drawn, culled, rasterized = perf.counters['draw.drawn'], perf.counters['draw.culled'], perf.counters['draw.rasterized']
+        last_drawn, last_culled, last_rasterized = self.last_draw_counts
+        self.last_draw_counts = (drawn, culled, rasterized)
+
+        frames = perf.recent_ms('frame')
+        lines = []
+        if frames:
+            p50, p95, p99 = perf.percentiles(frames)
+            lines.append(f"Frame ms  p50 {p50:.1f}  p95 {p95:.1f}  p99 {p99:.1f}  ({len(frames)} frames)")
+        else:
+            lines.append("Frame ms  (no frames yet)")
+        lines.append(f"Entities  drawn {drawn - last_drawn}  culled {culled - last_culled}"
+                     f"  rasterized {rasterized - last_rasterized}")
+        for name in perf.recent_names():
+            if name.startswith('frame.'):
+                times = perf.recent_ms(name)
+                lines.append(f"  {name[len('frame.'):]:<10}{sum(times) / len(times):8.2f} ms")
+
+        # Rendered uncached: the numbers change every frame
+        surfaces = [self.small_font.render(line, True, constants.WHITE) for line in lines]
+        width = max(surface.get_width() for surface in surfaces) + 20
+        height = sum(surface.get_height() + 2 for surface in surfaces) + 16
+        panel = pygame.Surface((width, height))
+        panel.set_alpha(200)
+        panel.fill(constants.BLACK)
+        self.screen.blit(panel, (10, 10))
+        y = 18
+        for surface in surfaces:
+            self.screen.blit(surface, (20, y))
+            y += surface.get_height() + 2
+
     def run(self):
         """Main application loop"""
+        if self.screen is None:
+            self.open_window()
         running = True
 
+        # Only redraw after input that can change what is on screen
+        dirty = True
+
         while running:
             for event in pygame.event.get():
+                if event.type != pygame.MOUSEMOTION or self.dragging:
+                    dirty = True
+
                 if event.type == pygame.QUIT:
                     running = False
 
@@ -389,18 +540,15 @@ class DXFViewer:
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_r:
                         self.auto_fit_view()
+                    elif event.key == pygame.K_F3:
+                        self.toggle_perf_overlay()
                     elif event.key == pygame.K_ESCAPE:
                         running = False
 
-            self.screen.fill(constants.BLACK)
-
-            for layer in self.selected_layers:
-                for entity in self.entities_by_layer.get(layer, []):
-                    self.draw_entity(entity)
-
-            self.draw_sidebar()
+            if dirty and running:
+                self.draw_frame()
+                dirty = False
 
-            pygame.display.flip()
             self.clock.tick(60)
 
         pygame.quit()
@@ -0,0 +1,145 @@
+import numpy as np
+
+# Positions snapped per pass; bounds the (position, candidate edge) pairs held at once
+SNAP_CHUNK = 1 << 14
+# (position, edge) distances computed per pass when a position has to be checked against every edge
+SCAN_CHUNK = 1 << 22
+# Grid cells per median edge length
+CELLS_PER_EDGE = 2
+# Widest block of cells searched around a position, in cells each way, before checking every edge
+MAX_REACH = 16
+
+
+class EdgeIndex:
+    """Uniform XY grid over the edges of a CompactGraph, for snapping many positions at once.
+
+    Each undirected edge is stored once, under the id of its directed entry
+    from the lower node id (an index into compact.neighbors), and listed in
+    every cell its bounding box covers. Cells are half as wide as the median
+    edge.
+    The index belongs to the graph it was built from; ids change when the
+    graph does.
+    """
+
+    def __init__(self, compact):
+        offsets = np.frombuffer(compact.offsets, dtype=np.int64)
+        neighbors = np.frombuffer(compact.neighbors, dtype=np.int32)
+        coords = np.frombuffer(compact.coords, dtype=np.float64).reshape(-1, 3)
+        sources = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        self.edges = np.flatnonzero(sources < neighbors)  # edge id per segment
+        self.a = coords[sources[self.edges]]
+        self.b = coords[neighbors[self.edges]]
+        self.ab = self.b - self.a
+        self.length2 = np.einsum('ij,ij->i', self.ab, self.ab)
+
+        spans = np.hypot(self.ab[:, 0], self.ab[:, 1])
+        self.cell = float(np.median(spans[spans > 0])) / CELLS_PER_EDGE if np.any(spans > 0) else 1.0
+
+        # Cell ranges covered by each segment's bounding box, flattened into (cell key, segment) pairs
+        lo = np.floor(np.minimum(self.a[:, :2], self.b[:, :2]) / self.cell).astype(np.int64)
+        hi = np.floor(np.maximum(self.a[:, :2], self.b[:, :2]) / self.cell).astype(np.int64)
+        nx, ny = hi[:, 0] - lo[:, 0] + 1, hi[:, 1] - lo[:, 1] + 1
+        per_segment = nx * ny
+        segment = np.repeat(np.arange(len(self.edges)), per_segment)
+        k = np.arange(per_segment.sum()) - np.repeat(np.cumsum(per_segment) - per_segment, per_segment)
+        cx = lo[segment, 0] + k // ny[segment]
+        cy = lo[segment, 1] + k % ny[segment]
+        keys = self._key(cx, cy)
+        order = np.lexsort((segment, keys))
+        keys, self.cell_segments = keys[order], segment[order]
+        self.keys, starts = np.unique(keys, return_index=True)
+        self.starts = np.append(starts, len(keys))
+
+    @staticmethod
+    def _key(cx, cy):
+        # Cell coordinates folded into one sortable integer (plans are far smaller than 2^31 cells across)
+        return (cx << 32) + (cy & 0xFFFFFFFF)
+
+    def __len__(self):
+        return len(self.edges)
+
+    def snap(self, positions, max_distance=np.inf):
+        """Snaps each row of an N x 3 array onto the nearest point of the nearest edge.
+
+        Returns NumPy arrays (edge, t, distance) of length N: the edge id, how
+        far along it from its lower-id end the nearest point lies (0 to 1), and
+        the 3D distance to that point. Rows with no edge within max_distance
+        get edge -1, t NaN and distance inf. Ties go to the lowest edge id.
+        """
+        p = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        edge = np.full(len(p), -1, dtype=np.int64)
+        t = np.full(len(p), np.nan)
+        distance = np.full(len(p), np.inf)
+        if not len(self.edges):
+            return edge, t, distance
+        # Visiting positions cell by cell keeps the grid lookups close together
+        order = np.argsort(self._key(*np.floor(p[:, :2] / self.cell).astype(np.int64).T), kind='stable')
+        p = p[order]
+        for start in range(0, len(p), SNAP_CHUNK):
+            part = slice(start, start + SNAP_CHUNK)
+            self._snap_near(p[part], 1, edge[part], t[part], distance[part])
+
+        # The block of cells `reach` cells around a position holds every edge
+        # closer than reach cell widths; widen it for positions whose best
+        # match may lie outside, and past the plan's extent check every edge
+        reach = 1
+        far = np.flatnonzero(distance > self.cell)
+        while len(far) and reach * self.cell < max_distance and reach < MAX_REACH:
+            reach *= 2
+            rows = far
+            found_edge, found_t, found_distance = edge[rows], t[rows], distance[rows]
+            self._snap_near(p[rows], reach, found_edge, found_t, found_distance)
+            edge[rows], t[rows], distance[rows] = found_edge, found_t, found_distance
+            far = rows[distance[rows] > reach * self.cell]
+        if len(far) and reach * self.cell < max_distance:
+            step = max(1, SCAN_CHUNK // len(self.edges))
+            for start in range(0, len(far), step):
+                rows = far[start:start + step]
+                point = np.repeat(rows, len(self.edges))
+                segment = np.tile(np.arange(len(self.edges)), len(rows))
+                self._keep_nearest(p, point, segment, edge, t, distance)
+
+        missed = distance > max_distance
+        edge[missed], t[missed], distance[missed] = -1, np.nan, np.inf
+        unsorted = np.empty_like(order)
+        unsorted[order] = np.arange(len(order))
+        return edge[unsorted], t[unsorted], distance[unsorted]
+
+    def _snap_near(self, p, reach, edge, t, distance):
+        """Fills in the nearest edge among those within `reach` cells of each position's cell (filled in place)."""
+        cx = np.floor(p[:, 0] / self.cell).astype(np.int64)
+        cy = np.floor(p[:, 1] / self.cell).astype(np.int64)
+        points, firsts, counts = [], [], []
+        for dx in range(-reach, reach + 1):
+            for dy in range(-reach, reach + 1):
+                keys = self._key(cx + dx, cy + dy)
+                slot = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+                hit = np.flatnonzero(self.keys[slot] == keys)
+                points.append(hit)
+                firsts.append(self.starts[slot[hit]])
+                counts.append(self.starts[slot[hit] + 1] - self.starts[slot[hit]])
+        points, firsts, counts = np.concatenate(points), np.concatenate(firsts), np.concatenate(counts)
+        point = np.repeat(points, counts)
+        entry = np.arange(counts.sum()) + np.repeat(firsts - (np.cumsum(counts) - counts), counts)
+        self._keep_nearest(p, point, self.cell_segments[entry], edge, t, distance)
+
+    def _keep_nearest(self, p, point, segment, edge, t, distance):
+        """Projects p[point] onto each paired segment and keeps, per position, the best seen so far."""
+        if not len(point):
+            return
+        ap = p[point] - self.a[segment]
+        length2 = self.length2[segment]
+        along = np.divide(np.einsum('ij,ij->i', ap, self.ab[segment]), length2,
+                          out=np.zeros(len(point)), where=length2 > 0)
+        along = np.clip(along, 0.0, 1.0)
+        d = np.linalg.norm(ap - along[:, None] * self.ab[segment], axis=1)
+
+        ids = self.edges[segment]
+        nearest = distance.copy()
+        np.minimum.at(nearest, point, d)
+        tied = np.flatnonzero(d == nearest[point])
+        lowest = np.where(nearest < distance, np.iinfo(np.int64).max, edge)
+        np.minimum.at(lowest, point[tied], ids[tied])
+        best = tied[ids[tied] == lowest[point[tied]]]
+        rows = point[best]
+        edge[rows], t[rows], distance[rows] = ids[best], along[best], d[best]
@@ -0,0 +1,345 @@
+import json
+import zipfile
+
+import numpy as np
+
+import perf
+
+# Max distance between a spline and its flattened polyline, in drawing units
+SPLINE_FLATTENING = 0.1
+SCREEN_COORD_LIMIT = 2 ** 30
+# Level of detail: primitives smaller than this on screen are drawn as a dot, and
+# polyline vertices closer together than this are merged
+LOD_MIN_PIXELS = 1.0
+# Culling grid resolution, and how many cells a primitive may cover before it is
+# kept on a short always-tested list instead
+GRID_CELLS = 256
+MAX_CELLS_PER_PRIMITIVE = 64
+# Bump whenever LayerGeometry's buffers or what build_layer_geometry packs change
+CACHE_FORMAT_VERSION = 1
+
+
+class GridIndex:
+    """Uniform grid over primitive bounding boxes, stored CSR-style (cell -> primitive ids)."""
+
+    def __init__(self, bounds, cells_per_side=GRID_CELLS):
+        self.bounds = bounds  # (N, 4): min_x, min_y, max_x, max_y per primitive
+        n = len(bounds)
+        if n == 0:
+            self.all_ids = np.arange(0)
+            return
+        self.all_ids = np.arange(n)
+        self.min_x = bounds[:, 0].min()
+        self.min_y = bounds[:, 1].min()
+        self.max_x = bounds[:, 2].max()
+        self.max_y = bounds[:, 3].max()
+        span = max(self.max_x - self.min_x, self.max_y - self.min_y)
+        self.cell = span / cells_per_side if span > 0 else 1.0
+        self.cols = cells_per_side + 1
+
+        cx0, cy0 = self._cells(bounds[:, 0], bounds[:, 1])
+        cx1, cy1 = self._cells(bounds[:, 2], bounds[:, 3])
+        widths = cx1 - cx0 + 1
+        counts = widths * (cy1 - cy0 + 1)
+        large = counts > MAX_CELLS_PER_PRIMITIVE
+        self.large = np.flatnonzero(large)
+
+        # One (cell key, primitive id) pair per covered cell, sorted by key
+        small = np.flatnonzero(~large)
+        counts = counts[small]
+        ids = np.repeat(small, counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        w = widths[ids]
+        keys = (cy0[ids] + local // w) * self.cols + cx0[ids] + local % w
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.ids = ids[order]
+
+    def _cells(self, x, y):
+        cx = np.clip(((x - self.min_x) / self.cell).astype(np.int64), 0, self.cols - 1)
+        cy = np.clip(((y - self.min_y) / self.cell).astype(np.int64), 0, self.cols - 1)
+        return cx, cy
+
+    def query(self, x0, y0, x1, y1):
+        """Ids of the primitives whose bounding box meets the rectangle, in ascending order."""
+        if len(self.all_ids) == 0 or x0 > self.max_x or x1 < self.min_x or y0 > self.max_y or y1 < self.min_y:
+            return np.arange(0)
+        if x0 <= self.min_x and y0 <= self.min_y and x1 >= self.max_x and y1 >= self.max_y:
+            return self.all_ids
+
+        (cx0, cx1), (cy0, cy1) = self._cells(np.array([x0, x1]), np.array([y0, y1]))
+        # Each row's cells have consecutive keys, so a row is one slice of the sorted keys
+        row_keys = np.arange(cy0, cy1 + 1) * self.cols
+        lo = np.searchsorted(self.keys, row_keys + cx0, side='left')
+        hi = np.searchsorted(self.keys, row_keys + cx1, side='right')
+        candidates = np.unique(np.concatenate([self.ids[a:b] for a, b in zip(lo, hi)] + [self.large]))
+
+        b = self.bounds[candidates]
+        hit = (b[:, 0] <= x1) & (b[:, 2] >= x0) & (b[:, 1] <= y1) & (b[:, 3] >= y0)
+        return candidates[hit]
+
+
+class DrawList:
+    """One frame's screen-space primitives for a layer, as plain Python lists ready for pygame."""
+
+    def __init__(self):
+        self.segments = []         # flat [x1, y1, x2, y2, ...]
+        self.polylines = []        # [(x, y), ...] for all runs back to back
+        self.polyline_starts = [0]
+        self.polyline_closed = []
+        self.circles = []          # flat [x, y, ...]
+        self.radii = []
+        self.markers = []          # flat [x, y, ...]
+        self.labels = []           # [[text, ...], ...] per marker
+        self.dots = []             # flat [x, y, ...]: primitives below the level-of-detail size
+        self.drawn = 0
+        self.culled = 0
+
+
+class LayerGeometry:
+    """Drawable geometry of one layer packed into NumPy buffers.
+
+    Every vertex lives in one (P, 2) `points` array so a frame needs a single
+    affine transform per layer; the primitive kinds are consecutive slices of it:
+
+      points[segments]   LINE start/end pairs
+      points[polylines]  LWPOLYLINE / POLYLINE vertices and pre-flattened SPLINEs,
+                         split into runs by `polyline_starts` (offsets within the slice)
+      points[circles]    CIRCLE / ARC centers, with `radii`
+      points[markers]    INSERT positions, with their ID / NAME `labels`
+    """
+
+    def __init__(self, segments, polylines, polyline_starts, polyline_closed, circles, radii, markers, labels):
+        self.points = np.concatenate([segments, polylines, circles, markers]).reshape(-1, 2)
+        a = len(segments)
+        b = a + len(polylines)
+        c = b + len(circles)
+        d = c + len(markers)
+        self.segments = slice(0, a)
+        self.polylines = slice(a, b)
+        self.circles = slice(b, c)
+        self.markers = slice(c, d)
+        self.polyline_starts = polyline_starts  # int array, one more entry than there are runs
+        self.polyline_closed = polyline_closed  # [bool, ...] per run
+        self.radii = radii                      # float array per circle
+        self.labels = labels                    # [[text, ...], ...] per marker
+
+        # Primitive ids run through segments, polylines, circles, then markers
+        self.n_segments = a // 2
+        self.n_polylines = len(polyline_closed)
+        self.n_circles = len(radii)
+        self.n_markers = len(labels)
+        self.index = GridIndex(self.primitive_bounds())
+
+    def __len__(self):
+        """Number of drawable primitives."""
+        return self.n_segments + self.n_polylines + self.n_circles + self.n_markers
+
+    def primitive_bounds(self):
+        """(N, 4) array of min_x, min_y, max_x, max_y per primitive id."""
+        seg = self.points[self.segments].reshape(-1, 4)
+        seg_bounds = np.column_stack([
+            np.minimum(seg[:, 0], seg[:, 2]), np.minimum(seg[:, 1], seg[:, 3]),
+            np.maximum(seg[:, 0], seg[:, 2]), np.maximum(seg[:, 1], seg[:, 3])])
+
+        poly = self.points[self.polylines]
+        if self.n_polylines:
+            starts = self.polyline_starts[:-1]
+            poly_bounds = np.column_stack([
+                np.minimum.reduceat(poly[:, 0], starts), np.minimum.reduceat(poly[:, 1], starts),
+                np.maximum.reduceat(poly[:, 0], starts), np.maximum.reduceat(poly[:, 1], starts)])
+        else:
+            poly_bounds = np.empty((0, 4))
+
+        centers = self.points[self.circles]
+        r = self.radii[:, None]
+        circle_bounds = np.hstack([centers - r, centers + r])
+
+        markers = self.points[self.markers]
+        marker_bounds = np.hstack([markers, markers])
+
+        return np.concatenate([seg_bounds, poly_bounds, circle_bounds, marker_bounds]).reshape(-1, 4)
+
+    def draw_list(self, scale, offset_x, offset_y, world_rect=None, min_pixels=LOD_MIN_PIXELS):
+        """Screen-space primitives for one frame, culled to world_rect and thinned by level of detail.
+
+        Every surviving vertex goes through one vectorized affine transform.
+        """
+        out = DrawList()
+        if world_rect is None:
+            ids = self.index.all_ids
+        else:
+            ids = self.index.query(*world_rect)
+        out.culled = len(self) - len(ids)
+
+        # Split the visible ids by primitive kind
+        a = self.n_segments
+        b = a + self.n_polylines
+        c = b + self.n_circles
+        seg_ids = ids[ids < a]
+        poly_ids = ids[(ids >= a) & (ids < b)] - a
+        circle_ids = ids[(ids >= b) & (ids < c)] - b
+        marker_ids = ids[ids >= c] - c
+
+        # Level of detail: segments and polylines smaller than min_pixels collapse to a dot
+        bounds = self.index.bounds
+        size = np.maximum(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1]) * scale
+        tiny_seg = size[seg_ids] < min_pixels
+        tiny_poly = size[poly_ids + a] < min_pixels
+        dot_rows = np.concatenate([2 * seg_ids[tiny_seg] + self.segments.start,
+                                   self.polyline_starts[poly_ids[tiny_poly]] + self.polylines.start])
+        seg_ids = seg_ids[~tiny_seg]
+        poly_ids = poly_ids[~tiny_poly]
+        # Circles whose radius rounds to zero pixels were never drawn
+        circle_ids = circle_ids[(self.radii[circle_ids] * scale).astype(np.int64) > 0]
+
+        # Gather every vertex needed this frame, then transform them in one go
+        seg_rows = (2 * seg_ids[:, None] + np.array([0, 1])).ravel() + self.segments.start
+        run_starts = self.polyline_starts[poly_ids]
+        run_lengths = self.polyline_starts[poly_ids + 1] - run_starts
+        poly_rows = (np.repeat(run_starts - np.cumsum(run_lengths) + run_lengths, run_lengths)
+                     + np.arange(run_lengths.sum()) + self.polylines.start)
+        circle_rows = circle_ids + self.circles.start
+        marker_rows = marker_ids + self.markers.start
+        rows = np.concatenate([seg_rows, poly_rows, circle_rows, marker_rows, dot_rows]).astype(np.int64)
+        screen = self.points[rows] * (scale, -scale) + (offset_x, offset_y)
+        # Keep far off-screen vertices within what pygame's C drawing calls accept
+        np.clip(screen, -SCREEN_COORD_LIMIT, SCREEN_COORD_LIMIT, out=screen)
+        screen = screen.astype(np.int64)
+
+        n_seg = len(seg_rows)
+        n_poly = n_seg + len(poly_rows)
+        n_circle = n_poly + len(circle_rows)
+        n_marker = n_circle + len(marker_rows)
+
+        out.segments = screen[:n_seg].ravel().tolist()
+
+        # Polylines: merge consecutive vertices that land on the same pixel
+        poly = screen[n_seg:n_poly]
+        if len(poly):
+            run_of = np.repeat(np.arange(len(poly_ids)), run_lengths)
+            keep = np.ones(len(poly), dtype=bool)
+            keep[1:] = (poly[1:] != poly[:-1]).any(axis=1) | (run_of[1:] != run_of[:-1])
+            kept_lengths = np.bincount(run_of[keep], minlength=len(poly_ids))
+            it = iter(poly[keep].ravel().tolist())
+            points = list(zip(it, it))
+            closed = [self.polyline_closed[k] for k in poly_ids.tolist()]
+            start = 0
+            for length, is_closed in zip(kept_lengths.tolist(), closed):
+                if length > 1:
+                    out.polylines.extend(points[start:start + length])
+                    out.polyline_starts.append(len(out.polylines))
+                    out.polyline_closed.append(is_closed)
+                else:
+                    out.dots.extend(points[start])
+                start += length
+
+        out.circles = screen[n_poly:n_circle].ravel().tolist()
+        out.radii = (self.radii[circle_ids] * scale).astype(np.int64).tolist()
+        out.markers = screen[n_circle:n_marker].ravel().tolist()
+        out.labels = [self.labels[k] for k in marker_ids.tolist()]
+
+        # Many sub-pixel primitives share a pixel; draw each pixel once
+        dots = screen[n_marker:]
+        if len(dots):
+            dots = np.unique(dots, axis=0)
+        out.dots.extend(dots.ravel().tolist())
+
+        out.drawn = len(ids)
+        return out
+
+    def nbytes(self):
+        return self.points.nbytes + self.polyline_starts.nbytes + self.radii.nbytes
+
+
+def _label_texts(entity):
+    return [attrib.dxf.text for attrib in entity.attribs if attrib.dxf.tag in ['ID', 'NAME']]
+
+
+def build_layer_geometry(entities):
+    """Converts a layer's ezdxf entities into a LayerGeometry; unsupported or broken entities are skipped."""
+    segments = []
+    polylines = []
+    polyline_starts = [0]
+    polyline_closed = []
+    circles = []
+    radii = []
+    markers = []
+    labels = []
+
+    for entity in entities:
+        try:
+            dxftype = entity.dxftype()
+            if dxftype == 'LINE':
+                start, end = entity.dxf.start, entity.dxf.end
+                segments.append((start[0], start[1]))
+                segments.append((end[0], end[1]))
+            elif dxftype in ('CIRCLE', 'ARC'):
+                # arcs are drawn as full circles, as before
+                circles.append((entity.dxf.center[0], entity.dxf.center[1]))
+                radii.append(entity.dxf.radius)
+            elif dxftype in ('LWPOLYLINE', 'POLYLINE', 'SPLINE'):
+                if dxftype == 'SPLINE':
+                    run = [(p[0], p[1]) for p in entity.flattening(SPLINE_FLATTENING)]
+                    closed = False
+                else:
+                    run = [(p[0], p[1]) for p in entity.get_points()]
+                    closed = entity.is_closed
+                if len(run) > 1:
+                    polylines.extend(run)
+                    polyline_starts.append(len(polylines))
+                    polyline_closed.append(closed)
+            elif dxftype == 'INSERT':
+                texts = _label_texts(entity)
+                markers.append((entity.dxf.insert[0], entity.dxf.insert[1]))
+                labels.append(texts)
+        except Exception:
+            pass
+
+    def packed(pts):
+        return np.array(pts, dtype=np.float64).reshape(-1, 2)
+
+    return LayerGeometry(
+        packed(segments), packed(polylines), np.array(polyline_starts, dtype=np.int64), polyline_closed,
+        packed(circles), np.array(radii, dtype=np.float64), packed(markers), labels)
+
+
+@perf.timed('build_geometry')
+def build_geometry(entities_by_layer):
+    """Returns { "Layer_Name": LayerGeometry } for every layer."""
+    return {layer: build_layer_geometry(entities) for layer, entities in entities_by_layer.items()}
+
+
+def save_geometry(f, geometry, meta):
+    """Writes { "Layer_Name": LayerGeometry } and a JSON-serializable `meta` to the binary file f, as a NumPy .npz."""
+    arrays = {}
+    labels = []
+    for i, g in enumerate(geometry.values()):
+        arrays[f'points{i}'] = g.points
+        arrays[f'ends{i}'] = np.array([g.segments.stop, g.polylines.stop, g.circles.stop, g.markers.stop], dtype=np.int64)
+        arrays[f'polyline_starts{i}'] = g.polyline_starts
+        arrays[f'polyline_closed{i}'] = np.array(g.polyline_closed, dtype=bool)
+        arrays[f'radii{i}'] = g.radii
+        labels.append(g.labels)
+    header = {'format': CACHE_FORMAT_VERSION, 'layers': list(geometry), 'labels': labels, 'meta': meta}
+    arrays['header'] = np.frombuffer(json.dumps(header).encode('utf-8'), dtype=np.uint8)
+    np.savez(f, **arrays)
+
+
+def load_geometry(path):
+    """Reads what save_geometry wrote as ({ "Layer_Name": LayerGeometry }, meta), or None if it cannot."""
+    try:
+        with np.load(path) as data:
+            header = json.loads(data['header'].tobytes().decode('utf-8'))
+            if header['format'] != CACHE_FORMAT_VERSION:
+                return None
+            geometry = {}
+            for i, (layer, labels) in enumerate(zip(header['layers'], header['labels'])):
+                points = data[f'points{i}']
+                a, b, c, d = data[f'ends{i}'].tolist()
+                geometry[layer] = LayerGeometry(
+                    points[:a], points[a:b], data[f'polyline_starts{i}'], data[f'polyline_closed{i}'].tolist(),
+                    points[b:c], data[f'radii{i}'], points[c:d], labels)
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+    return geometry, header['meta']
@@ -0,0 +1,149 @@
+import glob
+import hashlib
+import mmap
+import os
+import struct
+import sys
+
+import constants
+from compact_graph import CompactGraph
+
+# Bump whenever the file layout or the way build_graph interprets a DXF changes
+FORMAT_VERSION = 2
+
+MAGIC = b'NAVGRAPH'
+# magic, format version, padding, cache key, node count, directed edge count, names blob length
+HEADER = struct.Struct('<8sI4x32sQQQ')
+CACHE_DIR = '.navcache'
+
+
+def content_digest(path):
+    """sha256 hex digest of a file's contents."""
+    content = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            content.update(chunk)
+    return content.hexdigest()
+
+
+def cache_key(dxf_path, snapping_threshold, topology=constants.TRACK_TOPOLOGY):
+    """Digest of everything a built graph depends on: DXF contents, snapping threshold, topology and format version."""
+    key = f"{FORMAT_VERSION}:{float(snapping_threshold)!r}:{bool(topology)}:{content_digest(dxf_path)}"
+    return hashlib.sha256(key.encode('utf-8')).digest()
+
+
+def cache_path(dxf_path, key, cache_dir=None, suffix='.navgraph'):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(dxf_path)), CACHE_DIR)
+    return os.path.join(cache_dir, f"{os.path.basename(dxf_path)}-{key.hex()[:16]}{suffix}")
+
+
+def load_or_build(engine, dxf_path, get_entities, cache_dir=None):
+    """Loads engine's graph from the cache, or builds it from get_entities() and caches it.
+
+    Returns True on a cache hit, in which case get_entities is never called.
+    A cache that cannot be written is reported and otherwise ignored.
+    """
+    key = cache_key(dxf_path, engine.threshold, engine.topology)
+    compact = load_graph(dxf_path, engine.threshold, cache_dir, key)
+    if compact is not None:
+        engine.load_compact(compact)
+        print(f"✓ Graph loaded from cache: {len(compact)} nodes, {compact.edge_count()} edges")
+        return True
+
+    engine.build_graph(get_entities())
+    try:
+        save_graph(dxf_path, engine.threshold, engine.compact, cache_dir, key)
+    except OSError as e:
+        print(f"WARNING: Graph not cached: {e}")
+    return False
+
+
+def map_file(path):
+    """The file memory-mapped copy-on-write, or None if it cannot be opened."""
+    try:
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    except (OSError, ValueError):
+        return None
+
+
+def write_file(dxf_path, path, write, suffix='.navgraph'):
+    """Writes a cache file for dxf_path with write(f), then drops the DXF's older cache files with the same suffix.
+
+    The file is written under a temporary name and moved into place, so
+    readers never see it half written. Raises OSError if it cannot be.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    stale = glob.glob(os.path.join(glob.escape(os.path.dirname(path)), f"{glob.escape(os.path.basename(dxf_path))}-*{suffix}"))
+    for old in stale:
+        if old != path:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    return path
+
+
+def load_graph(dxf_path, snapping_threshold, cache_dir=None, key=None):
+    """Returns the cached CompactGraph for this DXF and threshold, or None on a miss.
+
+    The arrays are memory-mapped copy-on-write straight out of the cache file.
+    """
+    if sys.byteorder != 'little':
+        return None
+    if key is None:
+        key = cache_key(dxf_path, snapping_threshold)
+    mm = map_file(cache_path(dxf_path, key, cache_dir))
+    if mm is None or len(mm) < HEADER.size:
+        return None
+    magic, version, stored_key, n, m, names_len = HEADER.unpack_from(mm, 0)
+    expected = HEADER.size + 24 * n + 8 * (n + 1) + 12 * m + names_len
+    if magic != MAGIC or version != FORMAT_VERSION or stored_key != key or len(mm) != expected:
+        return None
+
+    view = memoryview(mm)
+    pos = HEADER.size
+
+    def take(fmt, count, itemsize):
+        nonlocal pos
+        section = view[pos:pos + count * itemsize].cast(fmt)
+        pos += count * itemsize
+        return section
+
+    coords = take('d', 3 * n, 8)
+    offsets = take('q', n + 1, 8)
+    weights = take('d', m, 8)
+    neighbors = take('i', m, 4)
+    blob = bytes(view[pos:pos + names_len])
+    names = blob.decode('utf-8').split('\0') if n else []
+    return CompactGraph(names, coords, offsets, neighbors, weights)
+
+
+def save_graph(dxf_path, snapping_threshold, compact, cache_dir=None, key=None):
+    """Writes `compact` to the cache and drops older cache files for the same DXF; raises OSError if it cannot."""
+    if sys.byteorder != 'little':
+        return None
+    if key is None:
+        key = cache_key(dxf_path, snapping_threshold)
+    compact = compact.compacted()
+    blob = '\0'.join(compact.names).encode('utf-8')
+
+    def write(f):
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, key, len(compact), len(compact.neighbors), len(blob)))
+        for section in (compact.coords, compact.offsets, compact.weights, compact.neighbors):
+            f.write(memoryview(section).cast('B'))
+        f.write(blob)
+    return write_file(dxf_path, cache_path(dxf_path, key, cache_dir), write)
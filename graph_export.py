@@ -0,0 +1,229 @@
+import argparse
+import heapq
+import json
+import os
+import sys
+from array import array
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+import constants
+import headless
+
+# Exporters walk the CompactGraph arrays node by node and write as they go, so
+# beyond the graph itself they hold one record at a time; removed nodes
+# (see NavigationEngine.update_graph) are skipped. Edges are undirected and
+# written once, from the lower node id.
+
+# Unsnapped track ends listed with their position in the report; the rest are only counted
+REPORT_SAMPLE = 20
+# Component sizes listed in the report, largest first
+REPORT_COMPONENTS = 10
+
+
+def _live(compact):
+    """Yields (node_id, name) for every node that has not been removed."""
+    for i, name in enumerate(compact.names):
+        if name is not None:
+            yield i, name
+
+
+def _undirected(compact):
+    """Yields (u, v, distance) once per undirected edge."""
+    neighbors, weights, offsets = compact.neighbors, compact.weights, compact.offsets
+    for u in range(len(compact)):
+        for k in range(offsets[u], offsets[u + 1]):
+            v = neighbors[k]
+            if u < v:
+                yield u, v, weights[k]
+
+
+def write_jsonl(compact, f):
+    """JSON Lines: a {"node", "pos"} record per node, then an {"edge", "distance"} record per edge."""
+    for i, name in _live(compact):
+        f.write(json.dumps({'node': name, 'pos': compact.position(i)}) + '\n')
+    names = compact.names
+    for u, v, distance in _undirected(compact):
+        f.write(json.dumps({'edge': [names[u], names[v]], 'distance': distance}) + '\n')
+
+
+def write_graphml(compact, f):
+    """GraphML, undirected: nodes n<id> with name / x / y / z data, edges with a distance."""
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+            '  <key id="name" for="node" attr.name="name" attr.type="string"/>\n'
+            '  <key id="x" for="node" attr.name="x" attr.type="double"/>\n'
+            '  <key id="y" for="node" attr.name="y" attr.type="double"/>\n'
+            '  <key id="z" for="node" attr.name="z" attr.type="double"/>\n'
+            '  <key id="distance" for="edge" attr.name="distance" attr.type="double"/>\n'
+            '  <graph id="navigation" edgedefault="undirected">\n')
+    for i, name in _live(compact):
+        x, y, z = compact.position(i)
+        f.write(f'    <node id="n{i}"><data key="name">{escape(name)}</data><data key="x">{x!r}</data>'
+                f'<data key="y">{y!r}</data><data key="z">{z!r}</data></node>\n')
+    for u, v, distance in _undirected(compact):
+        f.write(f'    <edge source="n{u}" target="n{v}"><data key="distance">{distance!r}</data></edge>\n')
+    f.write('  </graph>\n</graphml>\n')
+
+
+def write_npz(compact, path):
+    """NumPy .npz of the CSR arrays: coords (n, 3), offsets, neighbors, weights, and names.
+
+    names is the node names joined by NUL bytes, UTF-8 encoded, as in the
+    graph cache: bytes(data['names']).decode('utf-8').split('\\0'). The
+    arrays are written straight from the graph's buffers; only a graph with
+    removed nodes is copied, to renumber it without them.
+    """
+    compact = compact.compacted()
+    blob = '\0'.join(compact.names).encode('utf-8')
+    np.savez(path,
+             coords=np.frombuffer(compact.coords, dtype=np.float64).reshape(-1, 3),
+             offsets=np.frombuffer(compact.offsets, dtype=np.int64),
+             neighbors=np.frombuffer(compact.neighbors, dtype=np.int32),
+             weights=np.frombuffer(compact.weights, dtype=np.float64),
+             names=np.frombuffer(blob, dtype=np.uint8))
+
+
+def write_adjacency(compact, f):
+    """The adjacency listing build_graph used to print: each node, then a line per edge from it."""
+    for i, name in _live(compact):
+        f.write(f"{name}:{compact.position(i)}\n---------------------\n")
+        for j, distance in compact.edges(i):
+            f.write(f"{name}---{distance:.2f}---{compact.names[j]}\n")
+
+
+_WRITERS = {'.jsonl': write_jsonl, '.ndjson': write_jsonl, '.graphml': write_graphml, '.txt': write_adjacency}
+
+
+def export(compact, path):
+    """Writes the graph to `path` in the format its extension names: .jsonl / .ndjson, .graphml, .npz or .txt."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.npz':
+        write_npz(compact, path)
+    elif ext in _WRITERS:
+        with open(path, 'w', encoding='utf-8', buffering=1 << 20) as f:
+            _WRITERS[ext](compact, f)
+    else:
+        raise ValueError(f"Cannot tell the export format of '{path}' (use .jsonl, .graphml, .npz or .txt)")
+    print(f"✓ Graph exported to '{path}'")
+
+
+def components(compact):
+    """Yields the size of each connected component, isolated nodes included."""
+    label = array('b', bytes(len(compact)))  # 1 once a node has been reached
+    neighbors, offsets = compact.neighbors, compact.offsets
+    for s, _ in _live(compact):
+        if label[s]:
+            continue
+        label[s] = 1
+        stack = [s]
+        size = 0
+        while stack:
+            u = stack.pop()
+            size += 1
+            for k in range(offsets[u], offsets[u + 1]):
+                v = neighbors[k]
+                if not label[v]:
+                    label[v] = 1
+                    stack.append(v)
+        yield size
+
+
+def report(compact, unsnapped=None):
+    """Summary of the graph: degree histogram, connected components and unsnapped track ends.
+
+    unsnapped is NavigationEngine.unsnapped (x, y, z per end); pass None when
+    it is not known, e.g. for a graph loaded from the cache.
+    """
+    live = len(compact.ids)
+    degrees = np.diff(np.frombuffer(compact.offsets, dtype=np.int64))
+    histogram = np.bincount(degrees) if len(degrees) else np.zeros(1, dtype=np.int64)
+    histogram[0] -= len(compact) - live  # removed nodes have no edges either
+
+    count = 0
+    largest = []
+    for size in components(compact):
+        count += 1
+        if len(largest) < REPORT_COMPONENTS:
+            heapq.heappush(largest, size)
+        elif size > largest[0]:
+            heapq.heapreplace(largest, size)
+
+    summary = {
+        'nodes': live,
+        'edges': compact.edge_count(),
+        'degree_histogram': {int(d): int(n) for d, n in enumerate(histogram) if n},
+        'components': count,
+        'largest_components': sorted(largest, reverse=True),
+        'isolated_nodes': int(histogram[0]),
+        'unsnapped_endpoints': None,
+        'unsnapped_sample': [],
+    }
+    if unsnapped is not None:
+        summary['unsnapped_endpoints'] = len(unsnapped) // 3
+        summary['unsnapped_sample'] = [tuple(unsnapped[i:i + 3]) for i in range(0, min(len(unsnapped), 3 * REPORT_SAMPLE), 3)]
+    return summary
+
+
+def format_report(summary):
+    lines = [f"Graph: {summary['nodes']} nodes, {summary['edges']} edges",
+             "Degree histogram: " + ", ".join(f"{d}: {n}" for d, n in summary['degree_histogram'].items()),
+             f"Connected components: {summary['components']} (largest: "
+             f"{', '.join(map(str, summary['largest_components']))}), {summary['isolated_nodes']} isolated nodes"]
+    if summary['unsnapped_endpoints'] is None:
+        lines.append("Unsnapped track endpoints: unknown (graph loaded from the cache)")
+    else:
+        lines.append(f"Unsnapped track endpoints: {summary['unsnapped_endpoints']}")
+        lines.extend(f"  ({x:.2f}, {y:.2f}, {z:.2f})" for x, y, z in summary['unsnapped_sample'])
+        if summary['unsnapped_endpoints'] > len(summary['unsnapped_sample']):
+            lines.append(f"  ... and {summary['unsnapped_endpoints'] - len(summary['unsnapped_sample'])} more")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the navigation graph of a DXF floor plan, or summarize it.")
+    parser.add_argument('filename', help="DXF floor plan")
+    parser.add_argument('--export', metavar='FILE', action='append', default=[],
+                        help="write the graph to FILE, in the format its extension names: .jsonl, .graphml, .npz "
+                             "or .txt (the adjacency listing); may be given more than once")
+    parser.add_argument('--report', nargs='?', const='-', metavar='FILE',
+                        help="print a summary report, or write it to FILE as JSON; builds the graph from the DXF")
+    parser.add_argument('--threshold', type=float, default=constants.SNAPPING_THRESHOLD, help="snapping threshold")
+    parser.add_argument('--no-cache', action='store_true', help="always rebuild the graph from the DXF")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.filename):
+        print(f"ERROR: File '{args.filename}' not found.")
+        sys.exit(1)
+    if not args.export and args.report is None:
+        parser.error("give --export, --report or both")
+
+    try:
+        # Where track ends failed to snap is only known right after a build
+        engine = headless.load_engine(args.filename, args.threshold, use_cache=not (args.no_cache or args.report))
+    except IOError:
+        print(f"ERROR: Cannot read file '{args.filename}'")
+        sys.exit(1)
+    except Exception as e:
+        print(f"ERROR: {e}")
+        sys.exit(3)
+
+    try:
+        for path in args.export:
+            export(engine.compact, path)
+        if args.report is not None:
+            summary = report(engine.compact, engine.unsnapped)
+            if args.report == '-':
+                print(format_report(summary))
+            else:
+                with open(args.report, 'w', encoding='utf-8') as f:
+                    json.dump(summary, f, indent=1)
+                print(f"✓ Report written to '{args.report}'")
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
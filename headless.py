@@ -0,0 +1,142 @@
+import argparse
+import os
+import sys
+
+import constants
+import graph_cache
+import nav_engine
+import perf
+import plan_watch
+
+# Nothing here imports pygame, and ezdxf is only imported when the graph
+# cache misses, so a warm start never touches either.
+
+
+def load_engine(filename, snapping_threshold=constants.SNAPPING_THRESHOLD, use_cache=True, cache_dir=None,
+                track_changes=False):
+    """Returns a NavigationEngine with the graph for `filename`, from the graph cache when possible.
+
+    With track_changes the graph is always built from the DXF, since a cached
+    graph does not carry the plan that later edits are diffed against.
+    """
+    engine = nav_engine.NavigationEngine(snapping_threshold=snapping_threshold, track_changes=track_changes)
+    get_entities = entity_reader(filename)
+
+    if use_cache and not track_changes:
+        graph_cache.load_or_build(engine, filename, get_entities, cache_dir)
+    else:
+        engine.build_graph(get_entities())
+    return engine
+
+
+def entity_reader(filename):
+    """A function that streams the navigation layers of `filename` each time it is called."""
+    def get_entities():
+        import dxf_loader
+        return dxf_loader.stream_entities(filename)
+    return get_entities
+
+
+def format_matrix(names, matrix):
+    """Tab-separated distance matrix with a header row and column of waypoint IDs; blank where unreachable."""
+    lines = ['\t'.join([''] + names)]
+    for name, row in zip(names, matrix):
+        lines.append('\t'.join([name] + [f"{d:.2f}" if d < float('inf') else '' for d in row]))
+    return '\n'.join(lines)
+
+
+def format_route(source, target, route):
+    if route is None:
+        return f"{source} -> {target}: no route"
+    path, distance = route
+    return f"{source} -> {target}: {distance:.2f} ({' > '.join(path)})"
+
+
+def read_pairs(lines):
+    """Parses "source<TAB>target" lines, skipping blanks."""
+    for line in lines:
+        line = line.rstrip('\n')
+        if not line.strip():
+            continue
+        source, sep, target = line.partition('\t')
+        if not sep:
+            raise ValueError(f"Expected 'source<TAB>target', got {line!r}")
+        yield source, target
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer route queries on a DXF floor plan without opening a window.")
+    parser.add_argument('filename', help="DXF floor plan")
+    parser.add_argument('source', nargs='?', help="start waypoint ID (omit to read source<TAB>target pairs from stdin)")
+    parser.add_argument('target', nargs='?', help="destination waypoint ID")
+    parser.add_argument('--threshold', type=float, default=constants.SNAPPING_THRESHOLD, help="snapping threshold")
+    parser.add_argument('--no-cache', action='store_true', help="always rebuild the graph from the DXF")
+    parser.add_argument('--watch', action='store_true', help="keep running and answer the queries again whenever the DXF changes")
+    parser.add_argument('--landmarks', action='store_true', help="speed up searches with landmark distances, "
+                                                                 "built once per plan and kept beside the graph cache")
+    parser.add_argument('--matrix', action='store_true', help="read waypoint IDs from stdin, one per line, and print "
+                                                              "the distances between all of them as tab-separated text")
+    parser.add_argument('--perf', metavar='FILE', help="record timings and counters and write them to FILE on exit "
+                                                        "(a Chrome trace if it ends in .trace.json, else a JSON summary)")
+    args = parser.parse_args(argv)
+    if args.perf:
+        perf.enable()
+
+    if not os.path.exists(args.filename):
+        print(f"ERROR: File '{args.filename}' not found.")
+        sys.exit(1)
+    if (args.source is None) != (args.target is None):
+        parser.error("give both source and target, or neither")
+    if args.matrix and args.source is not None:
+        parser.error("--matrix reads its waypoints from stdin; give no source or target")
+
+    try:
+        engine = load_engine(args.filename, args.threshold, use_cache=not args.no_cache, track_changes=args.watch)
+        if args.landmarks:
+            import landmarks
+            landmarks.load_or_build(engine, args.filename)
+    except IOError:
+        print(f"ERROR: Cannot read file '{args.filename}'")
+        sys.exit(1)
+    except Exception as e:
+        print(f"ERROR: {e}")
+        sys.exit(3)
+
+    if args.matrix:
+        names = [line.strip() for line in sys.stdin if line.strip()]
+    elif args.source is not None:
+        pairs = [(args.source, args.target)]
+    else:
+        pairs = list(read_pairs(sys.stdin))
+
+    def answer():
+        try:
+            if args.matrix:
+                print(format_matrix(names, engine.distance_matrix(names, names)))
+                return True
+            routes = engine.route_many(pairs)
+        except KeyError as e:
+            print(f"ERROR: {e.args[0]}")
+            return False
+        for (source, target), route in zip(pairs, routes):
+            print(format_route(source, target, route))
+        return True
+
+    answered = answer()
+    if args.watch:
+        watcher = plan_watch.PlanWatcher(engine, args.filename, entity_reader(args.filename), use_cache=not args.no_cache,
+                                         use_landmarks=args.landmarks)
+        print(f"Watching '{args.filename}' for changes (Ctrl+C to stop)")
+        try:
+            watcher.watch(on_change=answer)
+        except KeyboardInterrupt:
+            pass
+
+    if args.perf:
+        perf.write(args.perf)
+    if not answered and not args.watch:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import hashlib
+import heapq
+import math
+import operator
+import os
+import struct
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import constants
+import graph_cache
+
+# ALT (A*, landmarks, triangle inequality): with the shortest distances from a
+# few landmark waypoints to every node, |d(L, t) - d(L, v)| bounds d(v, t) from
+# below, a much tighter A* heuristic than the straight line when corridors
+# wind. The table belongs to one graph and is stored beside its graph cache
+# file, under the same key, for the graph as the cache holds it.
+
+# Bump whenever the file layout changes
+FORMAT_VERSION = 2
+
+MAGIC = b'NAVLMARK'
+# magic, format version, padding, graph cache key, node order digest, node count, landmarks asked for, landmarks stored
+HEADER = struct.Struct('<8sI4x32s32sQQQ')
+# Table entry for nodes a landmark cannot reach: finite, so two of them cancel out instead of giving inf - inf
+UNREACHABLE = 1e300
+SUFFIX = '.landmarks'
+
+
+class Landmarks:
+    """Shortest distances from each landmark to every node, node-major: node v's are table[v * count:(v + 1) * count]."""
+
+    def __init__(self, ids, table, nodes, requested=None, digest=None):
+        self.ids = ids              # array('i'): landmark node ids
+        self.table = table          # array('d') or a memoryview of doubles
+        self.count = len(ids)
+        self.nodes = nodes          # number of node ids the table covers
+        self.requested = requested if requested is not None else len(ids)
+        self.digest = digest        # graph_digest of the graph the table was built for
+
+    def __len__(self):
+        return self.nodes
+
+    def bound(self, v, t):
+        """Lower bound on the distance between nodes v and t."""
+        c = self.count
+        return max(map(abs, map(operator.sub, self.table[v * c:v * c + c], self.table[t * c:t * c + c])), default=0.0)
+
+
+def graph_digest(compact):
+    """sha256 of a graph's node order, names and CSR offsets: a table only fits a graph with the same.
+
+    The same plan gets different node ids when built afresh and when patched
+    by update_graph, so the cache key alone does not pin them down.
+    """
+    digest = hashlib.sha256()
+    digest.update('\0'.join('\1' if name is None else name for name in compact.names).encode('utf-8'))
+    digest.update(memoryview(compact.offsets).cast('B'))
+    return digest.digest()
+
+
+def compacted(landmarks, compact):
+    """`landmarks`, built for `compact`, renumbered to fit compact.compacted(): the rows of removed nodes dropped."""
+    live = np.array([name is not None for name in compact.names], dtype=bool)
+    if live.all():
+        return landmarks
+    table = np.frombuffer(landmarks.table, dtype=np.float64).reshape(len(compact), landmarks.count)[live]
+    new_id = np.cumsum(live) - 1
+    ids = array('i', new_id[np.frombuffer(landmarks.ids, dtype=np.int32)].tolist())
+    values = array('d')
+    values.frombytes(table.tobytes())
+    return Landmarks(ids, values, int(live.sum()), landmarks.requested, graph_digest(compact.compacted()))
+
+
+def select_landmarks(compact, count=constants.LANDMARK_COUNT):
+    """Picks up to `count` landmark ids: the node furthest from the plan's centre in each of `count` equal angular sectors.
+
+    Landmarks around the edge of the plan bound well for routes in every
+    direction, and picking them from positions alone lets their searches
+    run in parallel. Sectors without a connected node are left out.
+    """
+    offsets = np.frombuffer(compact.offsets, dtype=np.int64)
+    candidates = np.flatnonzero(np.diff(offsets) > 0)  # removed and isolated nodes bound nothing
+    if not len(candidates) or count <= 0:
+        return array('i')
+    xy = np.frombuffer(compact.coords, dtype=np.float64).reshape(-1, 3)[candidates, :2]
+    offset = xy - xy.mean(axis=0)
+    sector = np.minimum((np.arctan2(offset[:, 1], offset[:, 0]) + math.pi) / (2 * math.pi) * count, count - 1).astype(np.int64)
+    reach = np.hypot(offset[:, 0], offset[:, 1])
+    order = np.lexsort((-reach, sector))  # by sector, furthest first
+    first = order[np.flatnonzero(np.diff(sector[order], prepend=-1))]
+    return array('i', candidates[first].tolist())
+
+
+def _dijkstra(offsets, neighbors, weights, source):
+    """Shortest distances from source to every node (math.inf where unreachable)."""
+    dist = array('d', [math.inf]) * (len(offsets) - 1)
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for k in range(offsets[u], offsets[u + 1]):
+            v = neighbors[k]
+            nd = d + weights[k]
+            if nd < dist[v]:
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
+
+
+# Per worker process: the CSR arrays searched, sent once when the worker starts
+_graph = None
+
+
+def _init_worker(offsets, neighbors, weights):
+    global _graph
+    _graph = []
+    for code, data in (('q', offsets), ('i', neighbors), ('d', weights)):
+        _graph.append(array(code))
+        _graph[-1].frombytes(data)
+
+
+def _worker_distances(source):
+    """Worker: one landmark's distances, as bytes."""
+    return _dijkstra(*_graph, source).tobytes()
+
+
+def build_landmarks(compact, count=constants.LANDMARK_COUNT, max_workers=None):
+    """Selects landmarks and computes their distance tables, one Dijkstra each across a process pool.
+
+    The searches use the graph's own lengths; see NavigationEngine.use_landmarks
+    for when the bound still holds after runtime weight changes.
+    """
+    ids = select_landmarks(compact, count)
+    if max_workers is None:
+        max_workers = min(len(ids), os.cpu_count() or 1)
+
+    if max_workers > 1:
+        graph = [bytes(memoryview(a).cast('B')) for a in (compact.offsets, compact.neighbors, compact.weights)]
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=graph) as pool:
+            columns = [np.frombuffer(data, dtype=np.float64) for data in pool.map(_worker_distances, ids)]
+    else:
+        columns = [np.frombuffer(_dijkstra(compact.offsets, compact.neighbors, compact.weights, s), dtype=np.float64)
+                   for s in ids]
+
+    table = np.column_stack(columns) if columns else np.zeros((len(compact), 0))
+    table[np.isinf(table)] = UNREACHABLE
+    values = array('d')
+    values.frombytes(table.tobytes())
+    return Landmarks(ids, values, len(compact), requested=count, digest=graph_digest(compact))
+
+
+def landmarks_path(dxf_path, key, cache_dir=None):
+    return graph_cache.cache_path(dxf_path, key, cache_dir, SUFFIX)
+
+
+def load_landmarks(dxf_path, key, compact, count=None, cache_dir=None):
+    """Returns the stored Landmarks for `compact`, the graph cached under `key`, or None on a miss.
+
+    A table built for the same plan with its nodes in another order is a
+    miss, and so, with count given, is one built for a different count.
+    The table is memory-mapped copy-on-write straight out of the file.
+    """
+    if sys.byteorder != 'little':
+        return None
+    mm = graph_cache.map_file(landmarks_path(dxf_path, key, cache_dir))
+    if mm is None or len(mm) < HEADER.size:
+        return None
+    magic, version, stored_key, digest, n, requested, stored = HEADER.unpack_from(mm, 0)
+    if (magic != MAGIC or version != FORMAT_VERSION or stored_key != key or n != len(compact)
+            or (count is not None and requested != count) or len(mm) != HEADER.size + 8 * n * stored + 4 * stored
+            or digest != graph_digest(compact)):
+        return None
+    view = memoryview(mm)
+    table = view[HEADER.size:HEADER.size + 8 * n * stored].cast('d')
+    ids = array('i')
+    ids.frombytes(view[HEADER.size + 8 * n * stored:])
+    return Landmarks(ids, table, n, requested, digest)
+
+
+def save_landmarks(dxf_path, key, landmarks, cache_dir=None):
+    """Writes `landmarks` beside the graph cache file for `key` and drops older ones for the same DXF; raises OSError if it cannot."""
+    if sys.byteorder != 'little':
+        return None
+
+    def write(f):
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, key, landmarks.digest, len(landmarks), landmarks.requested,
+                            landmarks.count))
+        f.write(memoryview(landmarks.table).cast('B'))
+        f.write(memoryview(landmarks.ids).cast('B'))
+    return graph_cache.write_file(dxf_path, landmarks_path(dxf_path, key, cache_dir), write, SUFFIX)
+
+
+def load_or_build(engine, dxf_path, count=constants.LANDMARK_COUNT, max_workers=None, cache_dir=None):
+    """Gives engine landmarks for its graph of `dxf_path`, loaded from beside the graph cache or built and stored there.
+
+    The engine must hold the graph as built from (or cached for) the DXF as
+    it is now, or as patched to match it; what is stored fits the graph as
+    save_graph writes it. Returns True if they were loaded.
+    """
+    key = graph_cache.cache_key(dxf_path, engine.threshold, engine.topology)
+    landmarks = load_landmarks(dxf_path, key, engine.compact, count, cache_dir)
+    hit = landmarks is not None
+    if not hit:
+        landmarks = build_landmarks(engine.compact, count, max_workers)
+        try:
+            save_landmarks(dxf_path, key, compacted(landmarks, engine.compact), cache_dir)
+        except OSError as e:
+            print(f"WARNING: Landmarks not cached: {e}")
+    engine.use_landmarks(landmarks)
+    print(f"✓ Landmarks {'loaded' if hit else 'built'}: {landmarks.count} landmarks over {len(landmarks)} nodes")
+    return hit
@@ -1,28 +1,42 @@
 import sys 
 import os 
+import constants
 import dxf_viewer as dxf
 import nav_engine 
+import graph_cache
+import perf
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python3 dxf_viewer.py <filename.dxf>")
+        print("Usage: python3 dxf_viewer.py <filename.dxf> [--perf FILE]")
         print("\nFor DWG files, convert to DXF first:")
         print("  python3 dwg_to_dxf.py your_file.dwg")
         sys.exit(1)
 
     filename = sys.argv[1]
+    # --perf FILE records spans and counters from the start and writes them on exit
+    # (a Chrome trace if FILE ends in .trace.json, else a JSON summary)
+    perf_path = None
+    if len(sys.argv) >= 4 and sys.argv[2] == '--perf':
+        perf_path = sys.argv[3]
+        perf.enable()
 
     if not os.path.exists(filename):
         print(f"ERROR: File '{filename}' not found.")
         sys.exit(1)
 
+    # Loads and groups the drawing; the window only opens in run()
     viewer = dxf.DXFViewer(filename)
 
-    engine = nav_engine.NavigationEngine(snapping_threshold=2.0)
-    engine.build_graph(viewer.get_entities())
+    engine = nav_engine.NavigationEngine(snapping_threshold=constants.SNAPPING_THRESHOLD)
+    graph_cache.load_or_build(engine, filename, viewer.get_entities)
+    viewer.release_entities()
     
     #print("Adjacency List:", engine.graph)
 
     viewer.run()
 
+    if perf_path is not None:
+        perf.write(perf_path)
+
 if __name__ == "__main__":
     main()
@@ -1,50 +1,1292 @@
+import bisect
+import heapq
 import math
+import struct
+from array import array
+from collections import Counter, OrderedDict
+
+import constants
+import perf
+from compact_graph import CompactGraph, NodesView, AdjacencyView
+
+# Entity geometry is kept packed: compact, and cheap to compare when diffing
+_POINT = struct.Struct('<3d')
+_SEGMENT = struct.Struct('<6d')
+# Track ends are indexed in cells this many snapping thresholds wide; coarse keeps the index small
+_ENDPOINT_CELL = 8
+# Junctions with the same name are closer than this: names round positions to hundredths
+_JUNCTION_NAME_SPAN = 0.02
+# An edit cutting more track lines than this, and a quarter of them, cuts them all again
+_RECUT_LIMIT = 64
+
+
+class _PlanSource:
+    """What the current graph was built from, kept so an edited plan can be diffed against it."""
+
+    def __init__(self):
+        self.waypoints = {}    # { handle: ("Node_Name", _POINT-packed position) }
+        self.tracks = {}       # { handle: _SEGMENT-packed start and end }
+        self.names = Counter() # { "Node_Name": number of waypoints carrying it }
+        self.snaps = {}        # { track handle: (start node_id or None, end node_id or None) }
+        self.node_tracks = {}  # { node_id: [track handle, ...] } one entry per track end snapped to the node
+        self.endpoints = {}    # { (cell_x, cell_y): [track handle, ...] } one entry per track end in the (coarse) cell
+        self.free = []         # ids of removed nodes, reused by the next waypoints added
+        self.loose = set()     # { track handle } of tracks with an end that snapped to no waypoint
+        self.topology = None   # _Topology of the plan as drawn, with topology
+
+
+class _TrackSplit:
+    """What _track_topology made of one track line as drawn, kept so an edit only cuts the lines near it again."""
+
+    __slots__ = ('ends', 'segment', 'loose', 'stops', 'junctions', 'pieces')
+
+    def __init__(self, ends, segment, loose):
+        self.ends = ends        # ((x, y, z), (x, y, z)) after snapping to waypoints
+        self.segment = segment  # (x0, y0, x1, y1) as swept, or None if the line has no length in plan view
+        self.loose = loose      # ends as drawn that snapped to no waypoint
+        self.stops = ()         # [(x, y, z), ...] where it is cut, ends included, before snapping
+        self.junctions = ()     # (("Junction(...)", _POINT-packed position), ...) added while cutting it
+        self.pieces = ()        # ((key, _SEGMENT-packed piece), ...)
+
+    def box(self):
+        """(x0, y0, x1, y1) around the line as snapped and swept."""
+        if self.segment is None:
+            x, y, _ = self.ends[0]
+            return (x, y, x, y)
+        x0, y0, x1, y1 = self.segment
+        return (x0, min(y0, y1), x1, max(y0, y1))
+
+
+class _Topology:
+    """A plan as drawn and what _track_topology made of it."""
+
+    def __init__(self, waypoints, tracks, splits, eps):
+        self.waypoints = waypoints  # { handle: ("Node_Name", _POINT-packed position) }
+        self.tracks = tracks        # { key: _SEGMENT-packed segment }
+        self.splits = splits        # { track key: _TrackSplit }, in file order
+        self.eps = eps              # tolerance the sweep ran with
+
+
+def _ends(segment):
+    x0, y0, z0, x1, y1, z1 = _SEGMENT.unpack(segment)
+    return (x0, y0, z0), (x1, y1, z1)
+
+
+def _cell(point, size):
+    return (math.floor(point[0] / size), math.floor(point[1] / size))
+
+
+def _nearest(cells, point, threshold, position, rank=None):
+    """Id of the point closest to `point` and less than `threshold` away, or None.
+
+    cells is { _cell(p, threshold): [id, ...] } and position(id) gives p.
+    Anything within the threshold in 3D is within it in the XY plane too, so
+    only the 3x3 block of cells around the point can hold a match. Ties go to
+    the lowest rank[id], or the lowest id without ranks.
+    """
+    best_key = (threshold, -1)
+    best = None
+    cx, cy = _cell(point, threshold)
+    for gx in (cx - 1, cx, cx + 1):
+        for gy in (cy - 1, cy, cy + 1):
+            for i in cells.get((gx, gy), ()):
+                key = (math.dist(point, position(i)), i if rank is None else rank[i])
+                if key[0] < threshold and key < best_key:
+                    best_key = key
+                    best = i
+    return best
+
+
+class _PointGrid:
+    """Points bucketed in cells one snapping threshold wide, for nearest-within-threshold lookups."""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.points = []  # [ (x, y, z), ... ]
+        self.cells = {}   # { (cell_x, cell_y): [point index, ...] }
+
+    def __getitem__(self, i):
+        return self.points[i]
+
+    def add(self, point):
+        i = len(self.points)
+        self.points.append(point)
+        self.cells.setdefault(_cell(point, self.threshold), []).append(i)
+        return i
+
+    def nearest(self, point):
+        """Index of the closest point less than the threshold away (ties go to the first added), or None."""
+        return _nearest(self.cells, point, self.threshold, self.points.__getitem__)
+
+    def copy(self):
+        grid = _PointGrid(self.threshold)
+        grid.points = list(self.points)
+        grid.cells = {cell: list(ids) for cell, ids in self.cells.items()}
+        return grid
+
+
+def _crossing(a, b, eps):
+    """Where 2D segments a and b, as (x0, y0, x1, y1), cross or touch; None if they don't or are parallel."""
+    ax, ay, rx, ry = a[0], a[1], a[2] - a[0], a[3] - a[1]
+    bx, by, sx, sy = b[0], b[1], b[2] - b[0], b[3] - b[1]
+    d = rx * sy - ry * sx
+    if d == 0:
+        return None
+    qx, qy = bx - ax, by - ay
+    t = (qx * sy - qy * sx) / d
+    u = (qx * ry - qy * rx) / d
+    et = eps / math.hypot(rx, ry)
+    eu = eps / math.hypot(sx, sy)
+    if not (-et <= t <= 1 + et and -eu <= u <= 1 + eu):
+        return None
+    t = min(max(t, 0.0), 1.0)
+    p = (ax + t * rx, ay + t * ry)
+    # Land exactly on a shared or touched end, so the sweep sees one event there
+    for end in ((a[0], a[1]), (a[2], a[3]), (b[0], b[1]), (b[2], b[3])):
+        if abs(p[0] - end[0]) <= eps and abs(p[1] - end[1]) <= eps:
+            return end
+    return p
+
+
+def _sweep_intersections(segments, eps):
+    """Bentley-Ottmann sweep over 2D segments (x0, y0, x1, y1), each with (x0, y0) <= (x1, y1).
+
+    Returns [(x, y, [segment index, ...]), ...]: every point where two or
+    more segments cross, touch or share an end, with the segments through
+    it. Takes O((n + k) log n) comparisons for n segments and k such points.
+    The status line is a plain list kept in order with bisect; points within
+    eps of a segment count as on it.
+    """
+    starts = {}  # { (x, y): [index of a segment starting there, ...] }
+    events = []
+    for i, (x0, y0, x1, y1) in enumerate(segments):
+        starts.setdefault((x0, y0), []).append(i)
+        events.append((x0, y0))
+        events.append((x1, y1))
+    heapq.heapify(events)
+
+    status = []  # segments crossing the sweep line, bottom to top just after the current event
+    px = py = 0.0
+
+    def y_at(i):
+        x0, y0, x1, y1 = segments[i]
+        if x1 - x0 <= eps:
+            return min(max(py, y0), y1)  # vertical: wherever the sweep point is on it
+        if px <= x0:
+            return y0
+        if px >= x1:
+            return y1
+        return y0 + (y1 - y0) * (px - x0) / (x1 - x0)
+
+    def slope(i):
+        x0, y0, x1, y1 = segments[i]
+        return (y1 - y0) / (x1 - x0) if x1 - x0 > eps else math.inf
+
+    def check(a, b):
+        p = _crossing(segments[a], segments[b], eps)
+        if p is not None and p > (px, py):
+            heapq.heappush(events, p)
+
+    found = []
+    last = None
+    while events:
+        p = heapq.heappop(events)
+        if p == last:
+            continue
+        last = p
+        px, py = p
+
+        # The segments through p sit next to each other on the status line
+        lo = bisect.bisect_left(status, py - eps, key=y_at)
+        hi = bisect.bisect_right(status, py + eps, key=y_at, lo=lo)
+        through = status[lo:hi]
+        upper = starts.get(p, [])
+        if len(through) + len(upper) > 1:
+            found.append((px, py, through + upper))
+
+        # Drop the ones ending here; the rest, and those starting here, go
+        # back in the order they leave p in, which swaps the crossing ones
+        ongoing = [i for i in through if segments[i][2] - px > eps or segments[i][3] - py > eps]
+        ongoing.extend(upper)
+        ongoing.sort(key=slope)
+        status[lo:hi] = ongoing
+        below = status[lo - 1] if lo > 0 else None
+        above = status[lo + len(ongoing)] if lo + len(ongoing) < len(status) else None
+        if ongoing:
+            if below is not None:
+                check(below, ongoing[0])
+            if above is not None:
+                check(ongoing[-1], above)
+        elif below is not None and above is not None:
+            check(below, above)
+    return found
+
 
 class NavigationEngine:
-    def __init__(self, snapping_threshold=1.0):
-        self.nodes = {}  # { "Node_Name": (x, y, z) }
-        self.graph = {}  # { "Node_Name": { "Neighbor_Name": distance } }
+    def __init__(self, snapping_threshold=1.0, max_cached_trees=256, track_changes=False,
+                 topology=constants.TRACK_TOPOLOGY):
         self.threshold = snapping_threshold
+        # Split tracks where they cross or meet, with junction nodes there (see _track_topology)
+        self.topology = topology
+        self._grid = None  # { (cell_x, cell_y): [node_id, ...] }, built on first snap
+        # Snapping ties go to the waypoint first in the file: the lowest id after build_graph, by this rank once
+        # update_graph has reused or appended ids out of file order
+        self._rank = None  # [file-order rank per node_id] or None
+        self._trees = OrderedDict()  # { source_id: (distances, predecessors) }, least recently used first
+        self.max_cached_trees = max_cached_trees
+        # Keep the plan behind the graph so update_graph can patch it; costs memory per entity
+        self.track_changes = track_changes
+        self._source = None
+        # Track ends that snapped to no waypoint, x, y, z each; None when the graph came from elsewhere
+        self.unsnapped = array('d')
+        # Runtime changes to walking costs, by waypoint name so they outlive rebuilds (see set_edge_weight)
+        self._overrides = {}  # { ("Name_A", "Name_B") in sorted order: weight }
+        self._closed_edges = set()  # { ("Name_A", "Name_B") in sorted order }
+        self._closed_nodes = set()  # { "Node_Name" }
+        self._freeze(CompactGraph.empty())
 
+    @perf.timed('build_graph')
     def build_graph(self, entities_by_layer):
         """Processes waypoints and track lines into a graph."""
-        self.nodes.clear()
-        self.graph.clear()
+        self._trees.clear()
+        waypoints, tracks, keyed = self._read_plan(entities_by_layer)
+        loose = array('d')
+        topology = None
+        if self.topology:
+            waypoints, tracks, loose, topology = self._track_topology(waypoints, tracks)
+        # Without handles there is nothing to diff future edits by
+        source = _PlanSource() if self.track_changes and keyed and self._grid_enabled() else None
+        names = []
+        ids = {}
+        coords = array('d')
 
         # 1. Extract Waypoints (Nodes)
-        waypoint_layer = 'Defpoints' 
-        for entity in entities_by_layer.get(waypoint_layer, []):
-            if entity.dxftype() == 'INSERT':
-                name = self._get_node_name(entity)
-                pos = entity.dxf.insert # (x, y, z)
-                self.nodes[name] = pos
-                self.graph[name] = {}
+        for name, pos in waypoints.values():
+            if name not in ids:
+                ids[name] = len(names)
+                names.append(name)
+                coords.extend((0.0, 0.0, 0.0))
+            i = 3 * ids[name]
+            coords[i:i + 3] = array('d', _POINT.unpack(pos))
+
+        self._names = names
+        self._coords = coords
+        self._grid = None
+        self._rank = None
 
         # 2. Extract Track Lines (Edges)
-        path_layer = 'trackline'
-        for entity in entities_by_layer.get(path_layer, []):
-            if entity.dxftype() == 'LINE':
-                start_pt = entity.dxf.start
-                end_pt = entity.dxf.end
-                
-                # Find which waypoints these coordinates 'snap' to
-                u = self._find_closest_node(start_pt)
-                v = self._find_closest_node(end_pt)
-
-                if u and v and u != v:
-                    dist = self._calculate_distance(self.nodes[u], self.nodes[v])
-                    self.graph[u][v] = dist
-                    self.graph[v][u] = dist # Bi-directional walking path
-
-        print(f"Graph Built: {len(self.nodes)} nodes, {sum(len(v) for v in self.graph.values())//2} edges")
-        
-        for start_pt,coords in self.nodes.items(): #.items() iterates key,value ,else only key is iterated over 
-            for node,adj_list in self.graph.items():
-                if(start_pt==node):
-                    print(f"{start_pt}:{coords}")
-                    print("---------------------")
-                    for end_pt,dist in adj_list.items():
-                        print(f"{start_pt}---{dist:.2f}---{end_pt}") 
+        rows = [{} for _ in names]  # { node_id: { neighbor_id: distance } } until frozen
+        misses = 0  # track ends that snapped to no waypoint
+        if source is not None:
+            source.waypoints = waypoints
+            source.tracks = tracks
+            source.names = Counter(name for name, _ in waypoints.values())
+            source.topology = topology
+        for key, segment in tracks.items():
+            start_pt, end_pt = _ends(segment)
+
+            # Find which waypoints these coordinates 'snap' to
+            u = self._find_closest_node(start_pt)
+            v = self._find_closest_node(end_pt)
+            if u is None:
+                misses += 1
+                loose.extend(start_pt)
+            if v is None:
+                misses += 1
+                loose.extend(end_pt)
+            if source is not None:
+                self._add_snap(source, key, u, v)
+
+            if self._forms_edge(u, v):
+                dist = self._calculate_distance(self._position(u), self._position(v))
+                rows[u][v] = dist
+                rows[v][u] = dist # Bi-directional walking path
+
+        grid = self._grid
+        self._freeze(CompactGraph.from_rows(names, coords, rows))
+        self._grid = grid  # same ids, still valid
+        self._source = source
+
+        self.unsnapped = loose
+        perf.count('graph.snaps', 2 * len(tracks) - misses)
+        perf.count('graph.snap_misses', misses)
+        print(f"Graph Built: {len(self.nodes)} nodes, {self.compact.edge_count()} edges")
+
+    def load_compact(self, compact):
+        """Uses an already built CompactGraph (e.g. from the graph cache) instead of building one."""
+        self._trees.clear()
+        self._source = None
+        self._rank = None
+        self.unsnapped = None
+        self._freeze(compact)
+
+    @perf.timed('update_graph')
+    def update_graph(self, entities_by_layer):
+        """Brings the graph in line with an edited plan, patching only what the edit touched.
+
+        Entities are matched to the previous build by handle and geometry
+        (with topology, track pieces by handle and position along the track).
+        Added, removed and moved waypoints and track lines re-snap just the
+        track ends near them, only the rows of nodes whose edges changed are
+        rewritten, and cached shortest path trees are dropped only if the
+        edit could change them. With topology, only the track lines near the
+        edit are swept and cut again (see _track_topology). Needs a graph
+        built with track_changes; falls back to build_graph without one, or
+        when an edited waypoint ID is used more than once, or entities
+        without handles. Returns a summary, or None after a full rebuild.
+        """
+        waypoints, tracks, keyed = self._read_plan(entities_by_layer)
+        if self._source is None or not keyed:
+            self.build_graph(entities_by_layer)
+            return None
+        source = self._source
+        loose = array('d')
+        topology = None
+        if self.topology:
+            waypoints, tracks, loose, topology = self._track_topology(waypoints, tracks, source.topology)
+
+        gone_waypoints = []
+        new_waypoints = []
+        for h, rec in source.waypoints.items() ^ waypoints.items():
+            (gone_waypoints if source.waypoints.get(h) == rec else new_waypoints).append((h, rec))
+        touched = {h for h, _ in source.tracks.items() ^ tracks.items()}
+
+        # A waypoint ID used twice resolves to whichever comes last in the
+        # file, which a diff cannot tell; rebuild rather than guess
+        names_count = source.names.copy()
+        names_count.subtract(name for _, (name, _) in gone_waypoints)
+        names_count.update(name for _, (name, _) in new_waypoints)
+        edited = {name for _, (name, _) in gone_waypoints}
+        placed = {name: _POINT.unpack(pos) for _, (name, pos) in new_waypoints}
+        edited.update(placed)
+        if any(source.names[name] > 1 or names_count[name] > 1 for name in edited):
+            self.build_graph(entities_by_layer)
+            return None
+
+        g = self.compact
+        if self._grid is None:
+            self._build_spatial_index()
+        removed, moved, added = [], [], []
+        for name in edited:
+            i = g.ids.get(name)
+            if i is None:
+                if name in placed:
+                    added.append(name)
+            elif name not in placed:
+                removed.append(i)
+            elif placed[name] != g.position(i):
+                moved.append(i)
+
+        # Every track end that was snapped to a removed or moved waypoint, or
+        # may now snap to a moved or added one, has to be snapped again
+        for i in removed + moved:
+            touched.update(source.node_tracks.get(i, ()))
+        for name in added:
+            touched.update(self._tracks_near(source, placed[name]))
+        for i in moved:
+            touched.update(self._tracks_near(source, placed[g.names[i]]))
+
+        dirty = set(removed + moved)
+        for h in touched:
+            if h in source.snaps:
+                dirty.update(i for i in self._drop_snap(source, h) if i is not None)
+
+        names = list(g.names)
+        ids = dict(g.ids)
+        coords = array('d')
+        coords.frombytes(memoryview(g.coords).cast('B'))
+        self._names = names
+        self._coords = coords
+        for i in removed:
+            self._grid[self._cell_of(g.position(i))].remove(i)
+            del ids[names[i]]
+            names[i] = None
+            source.free.append(i)
+        for i in moved:
+            self._grid[self._cell_of(g.position(i))].remove(i)
+            coords[3 * i:3 * i + 3] = array('d', placed[names[i]])
+            self._grid.setdefault(self._cell_of(placed[names[i]]), []).append(i)
+        for name in added:
+            if source.free:
+                i = source.free.pop()
+                names[i] = name
+            else:
+                i = len(names)
+                names.append(name)
+                coords.extend((0.0, 0.0, 0.0))
+            ids[name] = i
+            coords[3 * i:3 * i + 3] = array('d', placed[name])
+            self._grid.setdefault(self._cell_of(placed[name]), []).append(i)
+            dirty.add(i)
+        if added:
+            # Removing and moving waypoints keeps the others' file order; adding them does not
+            first = {}
+            for name, _ in waypoints.values():
+                first.setdefault(name, len(first))
+            self._rank = [first.get(name, -1) for name in names]
+
+        source.waypoints = waypoints
+        source.tracks = tracks
+        source.names = names_count
+        source.topology = topology
+        for h in touched:
+            if h in tracks:
+                start, end = _ends(tracks[h])
+                u = self._find_closest_node(start)
+                v = self._find_closest_node(end)
+                self._add_snap(source, h, u, v)
+                dirty.update(i for i in (u, v) if i is not None)
+
+        # Rewrite the dirty rows from the tracks snapped to each node
+        rows = {}
+        for i in dirty:
+            row = rows[i] = {}
+            for h in source.node_tracks.get(i, ()):
+                u, v = source.snaps[h]
+                if self._forms_edge(u, v):
+                    j = v if u == i else u
+                    row[j] = self._calculate_distance(self._position(i), self._position(j))
+
+        dropped = self._invalidate_trees(g, names, rows)
+        grid = self._grid
+        self._freeze(g.patched(names, coords, ids, rows))
+        self._grid = grid
+        for h in source.loose:
+            for i, point in zip(source.snaps[h], _ends(tracks[h])):
+                if i is None:
+                    loose.extend(point)
+        self.unsnapped = loose
+
+        summary = {'added': len(added), 'removed': len(removed), 'moved': len(moved),
+                   'tracks': len(touched), 'rows': len(rows), 'trees_dropped': dropped}
+        print(f"✓ Graph updated: +{len(added)} -{len(removed)} ~{len(moved)} waypoints, "
+              f"{len(touched)} track lines re-snapped, {len(rows)} rows rewritten, {dropped} cached trees dropped")
+        return summary
+
+    def _read_plan(self, entities_by_layer):
+        """Reads the plan into (waypoints, tracks, keyed), in file order.
+
+        waypoints is { key: (name, packed position) } and tracks is
+        { key: packed segment }, one per LINE and per polyline segment. Keys are
+        entity handles ((handle, n) for the nth polyline segment); keyed is
+        False if some entity had no handle, in which case keys are positional.
+        """
+        keyed = True
+        waypoints = {}
+        for entity in entities_by_layer.get(constants.WAYPOINT_LAYER, []):
+            if entity.dxftype() == 'INSERT':
+                key = getattr(entity.dxf, 'handle', None)
+                if key is None:
+                    keyed = False
+                    key = ('#', len(waypoints))
+                waypoints[key] = (self._get_node_name(entity), _POINT.pack(*entity.dxf.insert))
+        tracks = {}
+        for entity in entities_by_layer.get(constants.TRACK_LAYER, []):
+            dxftype = entity.dxftype()
+            if dxftype not in ('LINE', 'LWPOLYLINE', 'POLYLINE'):
+                continue
+            key = getattr(entity.dxf, 'handle', None)
+            if key is None:
+                keyed = False
+                key = ('#', len(tracks))
+            if dxftype == 'LINE':
+                tracks[key] = _SEGMENT.pack(*entity.dxf.start, *entity.dxf.end)
+                continue
+            # Polylines are walked vertex to vertex; arc segments (bulges) count as straight
+            if dxftype == 'LWPOLYLINE':
+                z = entity.dxf.elevation
+                points = [(x, y, z) for x, y in entity.get_points('xy')]
+                closed = entity.closed
+            else:
+                points = list(entity.points())
+                closed = entity.is_closed
+            if closed and len(points) > 2:
+                points.append(points[0])
+            for n in range(len(points) - 1):
+                tracks[(key, n)] = _SEGMENT.pack(*points[n], *points[n + 1])
+        return waypoints, tracks, keyed
+
+    @perf.timed('build_graph.topology')
+    def _track_topology(self, waypoints, tracks, previous=None):
+        """Splits track segments where they cross or meet; returns new (waypoints, tracks) plan records, the loose ends and a _Topology.
+
+        Segment ends are first pulled onto the waypoint they snap to. Ends
+        that snap to none are stretched by the snapping threshold, so a
+        corridor drawn just short of another still meets it. A sweep
+        (_sweep_intersections) then finds every crossing, T-junction and
+        shared end, and each segment is cut there unless the segments pass
+        each other at heights further apart than the threshold. Cut points
+        and loose ends not within the threshold of a waypoint become junction
+        waypoints, named after their position (x, y, z); they route like any
+        other waypoint.
+        The loose ends, as drawn, come back x, y, z each in an array('d').
+
+        With `previous`, the _Topology of the plan before an edit, only the
+        track lines near what the edit touched are swept and cut again, and
+        the rest keep their pieces; the result is the same either way.
+        """
+        loose = array('d')
+        if not self._grid_enabled():
+            return waypoints, tracks, loose, None
+
+        points = _PointGrid(self.threshold)
+        for _, pos in waypoints.values():
+            points.add(_POINT.unpack(pos))
+        resnap = None if previous is None else self._topology_edits(previous, waypoints, tracks)
+        splits = {}
+        for key, segment in tracks.items():
+            if resnap is None or key in resnap:
+                splits[key] = self._snap_track(points, segment)
+            else:
+                splits[key] = previous.splits[key]
+        scale = 1.0
+        for split in splits.values():
+            if split.segment is not None:
+                scale = max(scale, *map(abs, split.segment))
+        eps = scale * 1e-9
+
+        # Cut again: the track lines whose ends moved, and any that crossed or now cross one of them
+        recut = None  # keys of the track lines cut again; None for all of them
+        if resnap is not None and eps == previous.eps:
+            replaced = [split for key, split in previous.splits.items() if key not in splits or key in resnap]
+            recut = set(resnap)
+            recut.update(self._tracks_meeting(splits, replaced + [splits[key] for key in resnap]))
+        while True:
+            if recut is not None and len(recut) > max(_RECUT_LIMIT, len(splits) // 4):
+                recut = None  # about as quick to cut them all
+            if recut is None:
+                swept = list(splits)
+            else:
+                swept = self._tracks_meeting(splits, replaced + [splits[key] for key in recut])
+            cuts = self._track_cuts(splits, swept, eps)
+            new_waypoints, pieces = self._cut_tracks(points.copy(), waypoints, splits, cuts, recut)
+            if recut is None:
+                break
+            # A track line cut later snaps to the junctions the earlier ones
+            # added, so ones near a junction that came or went are cut again
+            more = self._junction_edits(previous, splits, swept, recut, replaced)
+            if not more:
+                break
+            recut.update(more)
+
+        for split in splits.values():
+            for point in split.loose:
+                loose.extend(point)
+        return new_waypoints, pieces, loose, _Topology(waypoints, tracks, splits, eps)
+
+    def _snap_track(self, points, segment):
+        """A _TrackSplit for one track line, its ends pulled onto the waypoints they snap to; not cut yet."""
+        a, b = _ends(segment)
+        ia, ib = points.nearest(a), points.nearest(b)
+        loose = (a,) if ia is None else ()
+        if ib is None:
+            loose += (b,)
+        if ia is not None:
+            a = points[ia]
+        if ib is not None:
+            b = points[ib]
+        r = self.threshold
+        length = math.hypot(b[0] - a[0], b[1] - a[1])
+        if length == 0:
+            return _TrackSplit((a, b), None, loose)
+        ux, uy = (b[0] - a[0]) / length, (b[1] - a[1]) / length
+        x0, y0 = a[0], a[1]
+        x1, y1 = b[0], b[1]
+        if ia is None:
+            x0, y0 = x0 - ux * r, y0 - uy * r
+        if ib is None:
+            x1, y1 = x1 + ux * r, y1 + uy * r
+        swept = (x0, y0, x1, y1) if (x0, y0) <= (x1, y1) else (x1, y1, x0, y0)
+        return _TrackSplit((a, b), swept, loose)
+
+    def _topology_edits(self, previous, waypoints, tracks):
+        """Keys of the track lines an edit may have moved the ends of: added or redrawn ones, and ones near an edited waypoint."""
+        edited = {key for key, segment in tracks.items() if previous.tracks.get(key) != segment}
+        moved = [_POINT.unpack(pos) for _, (_, pos) in previous.waypoints.items() ^ waypoints.items()]
+        if moved:
+            near = self._tracks_meeting(previous.splits, [(x, y, x, y) for x, y, _ in moved])
+            edited.update(key for key in near if key in tracks)
+        return edited
+
+    def _tracks_meeting(self, splits, near):
+        """Keys of the splits close enough to one of `near` (_TrackSplits or boxes) to be cut or snapped by it, in file order.
+
+        Ends as drawn are within the threshold of the line as snapped, and
+        junctions that could share a name within _JUNCTION_NAME_SPAN.
+        """
+        margin = self.threshold + max(self.threshold, _JUNCTION_NAME_SPAN)
+        boxes = [box.box() if isinstance(box, _TrackSplit) else box for box in near]
+        if not boxes:
+            return []
+        lx = min(box[0] for box in boxes) - margin
+        ly = min(box[1] for box in boxes) - margin
+        hx = max(box[2] for box in boxes) + margin
+        hy = max(box[3] for box in boxes) + margin
+        found = []
+        for key, split in splits.items():
+            # split.box(), unrolled: this runs over every track line in the plan
+            if split.segment is None:
+                x0, y0, _ = x1, y1, _ = split.ends[0]
+            else:
+                x0, y0, x1, y1 = split.segment
+                if y0 > y1:
+                    y0, y1 = y1, y0
+            if x1 < lx or x0 > hx or y1 < ly or y0 > hy:
+                continue
+            if any(x1 >= bx0 - margin and x0 <= bx1 + margin and y1 >= by0 - margin and y0 <= by1 + margin
+                   for bx0, by0, bx1, by1 in boxes):
+                found.append(key)
+        return found
+
+    def _track_cuts(self, splits, keys, eps):
+        """Sweeps the track lines `keys`; returns { key: [(x, y), ...] } of where each is to be cut."""
+        keys = [key for key in keys if splits[key].segment is not None]
+        ends = [splits[key].ends for key in keys]
+
+        def z_at(i, x, y):
+            (ax, ay, az), (bx, by, bz) = ends[i]
+            dx, dy = bx - ax, by - ay
+            t = min(max(((x - ax) * dx + (y - ay) * dy) / (dx * dx + dy * dy), 0.0), 1.0)
+            return az + t * (bz - az)
+
+        # Segments crossing in plan view only meet if they are within the
+        # threshold of each other in height there too (a bridge does not)
+        cuts = [[] for _ in keys]
+        for x, y, through in _sweep_intersections([splits[key].segment for key in keys], eps):
+            levels = sorted((z_at(i, x, y), i) for i in through)
+            group = [levels[0][1]]
+            for (z0, _), (z1, i) in zip(levels, levels[1:]):
+                if z1 - z0 >= self.threshold:
+                    if len(group) > 1:
+                        for j in group:
+                            cuts[j].append((x, y))
+                    group = []
+                group.append(i)
+            if len(group) > 1:
+                for j in group:
+                    cuts[j].append((x, y))
+        return {key: cut for key, cut in zip(keys, cuts) if cut}
+
+    def _cut_tracks(self, points, waypoints, splits, cuts, recut):
+        """Cuts the track lines in `recut` (all of them if None), in file order; returns (waypoints, pieces) with the junctions added.
+
+        Each cut point snaps to a waypoint or a junction added before it, or
+        becomes a new junction. Track lines not in recut keep their pieces
+        and add their junctions again, in turn, for later ones to snap to.
+        `points` holds the waypoints, and gets the junctions.
+        """
+        waypoints = dict(waypoints)
+        pieces = {}
+        for key, split in splits.items():
+            if split.segment is None:
+                continue
+            if recut is not None and key not in recut:
+                for name, pos in split.junctions:
+                    points.add(_POINT.unpack(pos))
+                    waypoints[name] = (name, pos)
+                pieces.update(split.pieces)
+                continue
+
+            if split.stops:  # cut before (kept from before the edit): start over on a copy
+                split = splits[key] = _TrackSplit(split.ends, split.segment, split.loose)
+            a, b = split.ends
+            dx, dy, dz = b[0] - a[0], b[1] - a[1], b[2] - a[2]
+            length2 = dx * dx + dy * dy
+            params = {0.0, 1.0}
+            for x, y in cuts.get(key, ()):
+                params.add(min(max(((x - a[0]) * dx + (y - a[1]) * dy) / length2, 0.0), 1.0))
+            split.stops = split.ends if len(params) == 2 else []  # uncut, the ends are near enough for _junction_edits
+            stops = []
+            for t in sorted(params):
+                p = (a[0] + t * dx, a[1] + t * dy, a[2] + t * dz)
+                if len(params) > 2:
+                    split.stops.append(p)
+                i = points.nearest(p)
+                if i is None:
+                    i = points.add(p)
+                    name = f"Junction({p[0]:.2f}, {p[1]:.2f}, {p[2]:.2f})"
+                    if name in waypoints:  # closer together than the rounding, yet further apart than the threshold
+                        n = 2
+                        while f"{name}#{n}" in waypoints:
+                            n += 1
+                        name = f"{name}#{n}"
+                    waypoints[name] = (name, _POINT.pack(*p))
+                    split.junctions += (waypoints[name],)
+                if not stops or stops[-1] != i:
+                    stops.append(i)
+            if len(stops) == 2:
+                split.pieces = ((key, _SEGMENT.pack(*points[stops[0]], *points[stops[1]])),)
+            else:
+                split.pieces = tuple(((key, n), _SEGMENT.pack(*points[stops[n]], *points[stops[n + 1]]))
+                                     for n in range(len(stops) - 1))
+            pieces.update(split.pieces)
+        return waypoints, pieces
+
+    def _junction_edits(self, previous, splits, swept, recut, replaced):
+        """Keys in `swept` but not `recut` of the track lines with a cut point near a junction that cutting recut added or dropped."""
+        before = set()
+        for split in replaced + [previous.splits[key] for key in recut if key in previous.splits]:
+            before.update(split.junctions)
+        after = set()
+        for key in recut:
+            after.update(splits[key].junctions)
+        changed = _PointGrid(max(self.threshold, _JUNCTION_NAME_SPAN))
+        for _, pos in before ^ after:
+            changed.add(_POINT.unpack(pos))
+        if not changed.points:
+            return []
+        return [key for key in swept
+                if key not in recut and any(changed.nearest(p) is not None for p in splits[key].stops)]
+
+    def _add_snap(self, source, handle, u, v):
+        source.snaps[handle] = (u, v)
+        if u is None or v is None:
+            source.loose.add(handle)
+        for i in (u, v):
+            if i is not None:
+                source.node_tracks.setdefault(i, []).append(handle)
+        for point in _ends(source.tracks[handle]):
+            source.endpoints.setdefault(self._endpoint_cell(point), []).append(handle)
+
+    def _drop_snap(self, source, handle):
+        """Forgets where a track line snapped (its geometry must still be in source.tracks); returns the old snap."""
+        snap = source.snaps.pop(handle)
+        source.loose.discard(handle)
+        for i in snap:
+            if i is not None:
+                source.node_tracks[i].remove(handle)
+        for point in _ends(source.tracks[handle]):
+            source.endpoints[self._endpoint_cell(point)].remove(handle)
+        return snap
+
+    def _tracks_near(self, source, point):
+        """Track lines with an end close enough to snap to a waypoint at `point`."""
+        x, y = point[0], point[1]
+        x0, y0 = self._endpoint_cell((x - self.threshold, y - self.threshold))
+        x1, y1 = self._endpoint_cell((x + self.threshold, y + self.threshold))
+        for gx in range(x0, x1 + 1):
+            for gy in range(y0, y1 + 1):
+                for h in source.endpoints.get((gx, gy), ()):
+                    start, end = _ends(source.tracks[h])
+                    if min(math.hypot(start[0] - x, start[1] - y), math.hypot(end[0] - x, end[1] - y)) < self.threshold:
+                        yield h
+
+    def _invalidate_trees(self, old, names, rows):
+        """Drops the cached trees that the rewritten rows could change; returns how many."""
+        changes = []  # (u, v, old weight or None, new weight or None) per changed directed edge
+        for u, row in rows.items():
+            # Trees were grown on the effective weights, runtime changes included
+            before = {old.neighbors[k]: self.weights[k] for k in range(old.offsets[u], old.offsets[u + 1])} if u < len(old) else {}
+            row = {v: self._effective(names[u], names[v], w) for v, w in row.items()}
+            for v in before.keys() | row.keys():
+                if before.get(v) != row.get(v):
+                    changes.append((u, v, before.get(v), row.get(v)))
+
+        n = len(old)
+        dropped = 0
+        for source in list(self._trees):
+            dist, prev = self._trees[source]
+            if names[source] != old.names[source]:
+                stale = True  # the source waypoint itself was removed
+            else:
+                stale = False
+                for u, v, before, after in changes:
+                    du = dist[u] if u < n else math.inf
+                    dv = dist[v] if v < n else math.inf
+                    # A tree edge got longer or went away, or a shortcut appeared
+                    if before is not None and v < n and prev[v] == u and (after is None or after > before):
+                        stale = True
+                    elif after is not None and du + after < dv:
+                        stale = True
+                    if stale:
+                        break
+            if stale:
+                del self._trees[source]
+                dropped += 1
+            elif len(dist) < len(names):
+                dist.extend([math.inf] * (len(names) - len(dist)))
+                prev.extend([-1] * (len(names) - len(prev)))
+        return dropped
+
+    def _freeze(self, compact):
+        """Makes `compact` the live graph; nodes and graph become read-only views over it."""
+        self.compact = compact
+        self._names = compact.names
+        self._coords = compact.coords
+        self._grid = None
+        self._edge_index = None  # EdgeIndex, built on first snap_to_edges
+        self.nodes = NodesView(compact)  # { "Node_Name": (x, y, z) }
+        self.graph = AdjacencyView(compact)  # { "Node_Name": { "Neighbor_Name": distance } }
+        # What searches walk on: compact.weights itself until a runtime change applies, then a copy
+        self.weights = compact.weights
+        self._heuristic_scale = 1.0
+        self.landmarks = None  # Landmarks for the ALT heuristic, built for this graph (see use_landmarks)
+        if self._overrides or self._closed_edges or self._closed_nodes:
+            # Trees kept across the change were checked against these weights already
+            self._apply_weights(self._state_slots(self._overrides.keys() | self._closed_edges, self._closed_nodes))
+
+    @perf.timed('route.shortest_path')
+    def shortest_path(self, source, target):
+        """Returns (path, distance) between two waypoints, or None if they are not connected."""
+        s = self._node_id(source)
+        t = self._node_id(target)
+
+        # A reusable tree from either end already answers the query
+        if s in self._trees:
+            return self._route(self._tree(s), s, t)
+        if t in self._trees:
+            return self._reversed(self._route(self._tree(t), t, s))
+
+        return self._astar(s, t)
+
+    @perf.timed('route.shortest_path_tree')
+    def shortest_path_tree(self, source):
+        """One-to-all Dijkstra from source as ({ name: distance }, { name: predecessor }), for reachable waypoints."""
+        dist, prev = self._tree(self._node_id(source))
+        names = self.compact.names
+        distances = {}
+        predecessors = {}
+        for v, d in enumerate(dist):
+            if d < math.inf:
+                distances[names[v]] = d
+                predecessors[names[v]] = names[prev[v]] if prev[v] >= 0 else None
+        return distances, predecessors
+
+    @perf.timed('route.distances')
+    def distances(self, source, targets):
+        """Shortest distances from source to each of targets (math.inf if unreachable), from one reusable tree."""
+        dist, _ = self._tree(self._node_id(source))
+        return [dist[self._node_id(target)] for target in targets]
+
+    @perf.timed('route.distance_matrix')
+    def distance_matrix(self, sources, targets):
+        """Shortest distances from each source to each target, one row per source (math.inf if unreachable).
+
+        Runs one search per source, or per target if there are fewer; each
+        stops as soon as every waypoint on the other side is settled, and a
+        cached tree is used as it is.
+        """
+        source_ids = [self._node_id(name) for name in sources]
+        target_ids = [self._node_id(name) for name in targets]
+        if len(target_ids) < len(source_ids):
+            columns = [self._distances_to(t, source_ids) for t in target_ids]
+            return [list(row) for row in zip(*columns)] if columns else [[] for _ in source_ids]
+        return [self._distances_to(s, target_ids) for s in source_ids]
+
+    def use_landmarks(self, landmarks):
+        """Tightens the A* heuristic with landmark distances (see landmarks.py); None turns it off again.
+
+        The landmarks must have been built for this very graph. They are
+        dropped whenever the graph changes, and are left unused while any
+        edge has been made cheaper than its length (see set_edge_weight),
+        since their bounds no longer hold then; closures and dearer edges
+        keep them valid.
+        """
+        if landmarks is not None and len(landmarks) != len(self.compact):
+            raise ValueError(f"Landmarks cover {len(landmarks)} nodes, the graph has {len(self.compact)}")
+        self.landmarks = landmarks
+
+    @perf.timed('route.route_many')
+    def route_many(self, pairs):
+        """Answers a batch of (source, target) queries, in order, computing each tree at most once."""
+        pairs = [(self._node_id(source), self._node_id(target)) for source, target in pairs]
+
+        # Walking paths are bi-directional, so a pair can be served from either
+        # end. Serve each pair from whichever end is shared by more of the batch.
+        counts = {}
+        for s, t in pairs:
+            counts[s] = counts.get(s, 0) + 1
+            counts[t] = counts.get(t, 0) + 1
+
+        results = [None] * len(pairs)
+        groups = {}  # { node_id served from: [(pair index, other end, served from the target), ...] }
+        for n, (s, t) in enumerate(pairs):
+            if s in self._trees or t in self._trees or counts[s] == counts[t] == 1:
+                results[n] = self.shortest_path(self.compact.names[s], self.compact.names[t])
+            elif counts[s] >= counts[t]:
+                groups.setdefault(s, []).append((n, t, False))
+            else:
+                groups.setdefault(t, []).append((n, s, True))
+
+        # Each group is answered right after its tree is built, so a batch
+        # with more ends than max_cached_trees never has to build one again
+        for end, group in groups.items():
+            tree = self._tree(end)
+            for n, other, backwards in group:
+                route = self._route(tree, end, other)
+                results[n] = self._reversed(route) if backwards else route
+        return results
+
+    @perf.timed('route.snap_to_edges')
+    def snap_to_edges(self, positions, max_distance=math.inf):
+        """Snaps each row of an N x 3 array of positions onto the nearest point of the nearest edge.
+
+        Returns NumPy arrays (edge, t, distance), one entry per position: the
+        edge id (see CompactGraph.edge_ends), how far along the edge the
+        point lies (0 at its lower-id end, 1 at the other) and the distance to
+        it. Positions with no edge within max_distance get edge -1. Edge ids
+        belong to the current graph; pass them to route_from_edge before the
+        graph changes.
+        """
+        if self._edge_index is None:
+            import edge_index  # NumPy is only needed once positions are snapped
+            self._edge_index = edge_index.EdgeIndex(self.compact)
+        return self._edge_index.snap(positions, max_distance)
+
+    def route_from_edge(self, edge, t, target):
+        """Returns (path, distance) from the point t along `edge` (as from snap_to_edges) to a waypoint, or None.
+
+        The path starts at whichever end of the edge the route leaves by, and
+        the distance includes the stretch of the edge up to that end. Routes
+        come from the target's shortest path tree, so many positions headed
+        for the same waypoint share one search.
+        """
+        if edge < 0:
+            return None
+        g = self.compact
+        u, v = g.edge_ends(edge)
+        tgt = self._node_id(target)
+        dist, prev = self._tree(tgt)
+        w = self.weights[edge]
+        # A closed edge cannot be walked along, not even part of the way
+        distance, lead = min((dist[u] + (t * w if t > 0 else 0.0), u), (dist[v] + ((1 - t) * w if t < 1 else 0.0), v))
+        if distance == math.inf:
+            return None
+        path, _ = self._reversed(self._route((dist, prev), tgt, lead))
+        return path, float(distance)
+
+    def set_edge_weight(self, a, b, weight):
+        """Sets the walking cost of the edge between waypoints a and b, both ways; None restores its length.
+
+        Use it for congestion, slow stairs and the like. Cached shortest path
+        trees are repaired rather than dropped (see _repair_trees). Returns the
+        changes, as for set_dynamic_state. Raises KeyError if a and b are not
+        joined by an edge and ValueError for a negative weight.
+        """
+        pair = self._edge_pair(a, b)
+        if weight is None:
+            self._overrides.pop(pair, None)
+        elif not weight >= 0:
+            raise ValueError(f"Edge weight must be zero or more, got {weight!r}")
+        else:
+            self._overrides[pair] = float(weight)
+        return self._reweigh(self._state_slots((pair,), ()))
+
+    def block_edge(self, a, b):
+        """Closes the edge between waypoints a and b until unblock_edge; returns the changes."""
+        pair = self._edge_pair(a, b)
+        self._closed_edges.add(pair)
+        return self._reweigh(self._state_slots((pair,), ()))
+
+    def unblock_edge(self, a, b):
+        pair = self._edge_pair(a, b)
+        self._closed_edges.discard(pair)
+        return self._reweigh(self._state_slots((pair,), ()))
+
+    def block_node(self, name):
+        """Closes a waypoint and every edge at it until unblock_node; returns the changes."""
+        self._node_id(name)
+        self._closed_nodes.add(name)
+        return self._reweigh(self._state_slots((), (name,)))
+
+    def unblock_node(self, name):
+        self._node_id(name)
+        self._closed_nodes.discard(name)
+        return self._reweigh(self._state_slots((), (name,)))
+
+    def dynamic_state(self):
+        """The runtime weight overrides and closures, as a picklable (overrides, closed edges, closed nodes)."""
+        return dict(self._overrides), frozenset(self._closed_edges), frozenset(self._closed_nodes)
+
+    def set_dynamic_state(self, state):
+        """Replaces every runtime override and closure with those of dynamic_state() from this or another engine.
+
+        Returns the changes as [(from waypoint, to waypoint, old weight, new
+        weight), ...], one per directed edge whose walking cost changed
+        (math.inf while closed). Entries naming edges this graph lacks are
+        kept, and apply once the edge exists.
+        """
+        overrides, closed_edges, closed_nodes = state
+        pairs = {pair for pair, _ in self._overrides.items() ^ overrides.items()} | (self._closed_edges ^ closed_edges)
+        nodes = self._closed_nodes ^ closed_nodes
+        self._overrides = dict(overrides)
+        self._closed_edges = set(closed_edges)
+        self._closed_nodes = set(closed_nodes)
+        return self._reweigh(self._state_slots(pairs, nodes))
+
+    def route_stale(self, route, changes):
+        """Whether the changes could alter a route (path, distance), or None for no route, answered before them.
+
+        It could if the route walks an edge that got dearer or closed, or if
+        an edge that got cheaper might offer a shortcut: the straight-line
+        distances to and from the edge, scaled like the A* heuristic, give a
+        lower bound for the detour through it.
+        """
+        if route is None:
+            return any(after < before for _, _, before, after in changes)
+        path, distance = route
+        walked = set(zip(path, path[1:]))
+        ends = self.nodes[path[0]], self.nodes[path[-1]]
+        for a, b, before, after in changes:
+            if after > before:
+                if (a, b) in walked or (b, a) in walked:
+                    return True
+            elif (self._heuristic_scale * (self._calculate_distance(ends[0], self.nodes[a])
+                                           + self._calculate_distance(self.nodes[b], ends[1])) + after) < distance:
+                return True
+        return False
+
+    def _edge_pair(self, a, b):
+        u, v = self._node_id(a), self._node_id(b)
+        if not any(n == v for n, _ in self.compact.edges(u)):
+            raise KeyError(f"No edge between '{a}' and '{b}'")
+        return (a, b) if a <= b else (b, a)
+
+    def _effective(self, a, b, length):
+        """Walking cost of the edge from waypoint a to b, given its length, with runtime changes applied."""
+        pair = (a, b) if a <= b else (b, a)
+        if a in self._closed_nodes or b in self._closed_nodes or pair in self._closed_edges:
+            return math.inf
+        return self._overrides.get(pair, length)
+
+    def _state_slots(self, pairs, nodes):
+        """Directed edge indices of the named edges and of every edge at the named waypoints, where they exist."""
+        g = self.compact
+        slots = []
+        for a, b in pairs:
+            u, v = g.ids.get(a), g.ids.get(b)
+            if u is not None and v is not None:
+                slots.extend(k for x, y in ((u, v), (v, u)) for k in range(g.offsets[x], g.offsets[x + 1]) if g.neighbors[k] == y)
+        for name in nodes:
+            u = g.ids.get(name)
+            if u is not None:
+                for v, _ in g.edges(u):
+                    slots.extend(k for x, y in ((u, v), (v, u)) for k in range(g.offsets[x], g.offsets[x + 1]) if g.neighbors[k] == y)
+        return slots
+
+    def _reweigh(self, slots):
+        """Recomputes the walking cost of the given directed edges and repairs cached trees; returns the changes."""
+        changes = self._apply_weights(slots)
+        repaired = self._repair_trees(changes)
+        perf.count('route.edges_reweighed', len(changes))
+        if changes:
+            print(f"✓ Walking costs changed on {len(changes) // 2} edges, {repaired} cached trees repaired")
+        names = self.compact.names
+        return [(names[u], names[v], before, after) for u, v, before, after in changes]
+
+    def _apply_weights(self, slots):
+        """Writes the effective walking cost of the given directed edges into weights; returns (u, v, old, new) changes."""
+        g = self.compact
+        names = g.names
+        if self.weights is g.weights and slots:
+            self.weights = array('d', g.weights)
+        changes = []  # (u, v, old weight, new weight)
+        for k in set(slots):
+            u, v = g.edge_ends(k)
+            after = self._effective(names[u], names[v], g.weights[k])
+            if after != self.weights[k]:
+                changes.append((u, v, self.weights[k], after))
+                self.weights[k] = after
+
+        # Straight-line A* stays exact while every edge costs at least its length times this
+        scale = 1.0
+        for (a, b), weight in self._overrides.items():
+            u, v = g.ids.get(a), g.ids.get(b)
+            for n, length in (g.edges(u) if u is not None and v is not None else ()):
+                if n == v and length > 0:
+                    scale = min(scale, weight / length)
+        self._heuristic_scale = scale
+        return changes
+
+    def _repair_trees(self, changes):
+        """Brings every cached tree up to date with the (u, v, old, new) directed edge changes; returns how many changed.
+
+        Dynamic SSSP in the Ramalingam-Reps style, per tree: the subtrees
+        hanging off tree edges that got dearer or closed lose their distances
+        and are re-seeded from their neighbours outside them, edges that got
+        cheaper seed the nodes they now reach for less, and one Dijkstra pass
+        from those seeds settles only what moved. Walking paths are
+        bi-directional, so every change comes in both directions.
+        """
+        if not changes:
+            return 0
+        g = self.compact
+        offsets, neighbors, weights = g.offsets, g.neighbors, self.weights
+        repaired = 0
+        for dist, prev in self._trees.values():
+            orphans = []
+            for u, v, before, after in changes:
+                if after > before and prev[v] == u:
+                    prev[v] = -1
+                    stack = [v]
+                    while stack:
+                        x = stack.pop()
+                        orphans.append(x)
+                        dist[x] = math.inf
+                        for k in range(offsets[x], offsets[x + 1]):
+                            w = neighbors[k]
+                            if prev[w] == x:
+                                prev[w] = -1
+                                stack.append(w)
+
+            heap = []
+            for x in orphans:
+                for k in range(offsets[x], offsets[x + 1]):
+                    w = neighbors[k]
+                    d = dist[w] + weights[k]
+                    if d < dist[x]:
+                        dist[x] = d
+                        prev[x] = w
+                if dist[x] < math.inf:
+                    heap.append((dist[x], x))
+            for u, v, before, after in changes:
+                if after < before and dist[u] + after < dist[v]:
+                    dist[v] = dist[u] + after
+                    prev[v] = u
+                    heap.append((dist[v], v))
+            if not orphans and not heap:
+                continue
+
+            repaired += 1
+            heapq.heapify(heap)
+            while heap:
+                d, u = heapq.heappop(heap)
+                if d > dist[u]:
+                    continue
+                for k in range(offsets[u], offsets[u + 1]):
+                    v = neighbors[k]
+                    nd = d + weights[k]
+                    if nd < dist[v]:
+                        dist[v] = nd
+                        prev[v] = u
+                        heapq.heappush(heap, (nd, v))
+        perf.count('route.tree_repairs', repaired)
+        return repaired
+
+    def _distances_to(self, source, targets):
+        """Distances from source to each of targets, from a cached tree or a search that stops once all are settled."""
+        if source in self._trees:
+            dist, _ = self._tree(source)
+            return [dist[t] for t in targets]
+
+        g = self.compact
+        offsets, neighbors, weights = g.offsets, g.neighbors, self.weights
+        remaining = set(targets)
+        dist = {source: 0.0}
+        settled = set()
+        heap = [(0.0, source)]
+        while heap and remaining:
+            d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+            remaining.discard(u)
+            for k in range(offsets[u], offsets[u + 1]):
+                v = neighbors[k]
+                nd = d + weights[k]
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return [dist[t] if t not in remaining else math.inf for t in targets]
+
+    def _node_id(self, name):
+        try:
+            return self.compact.ids[name]
+        except KeyError:
+            raise KeyError(f"Unknown waypoint '{name}'") from None
+
+    def _tree(self, source):
+        if source in self._trees:
+            self._trees.move_to_end(source)
+            perf.count('route.tree_hits')
+            return self._trees[source]
+        perf.count('route.tree_builds')
+
+        g = self.compact
+        offsets, neighbors, weights = g.offsets, g.neighbors, self.weights
+        dist = array('d', [math.inf]) * len(g)
+        prev = array('i', [-1]) * len(g)
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            for k in range(offsets[u], offsets[u + 1]):
+                v = neighbors[k]
+                nd = d + weights[k]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    prev[v] = u
+                    heapq.heappush(heap, (nd, v))
+
+        self._trees[source] = (dist, prev)
+        while len(self._trees) > self.max_cached_trees:
+            self._trees.popitem(last=False)
+        return dist, prev
+
+    def _astar(self, source, target):
+        g = self.compact
+        offsets, neighbors, weights, coords = g.offsets, g.neighbors, self.weights, g.coords
+        gx, gy, gz = g.position(target)
+        scale = self._heuristic_scale
+        # Landmark distances were measured on the graph's lengths, so they only bound routes no edge made cheaper
+        landmarks = self.landmarks if scale >= 1.0 else None
+        if landmarks is not None:
+            # The landmarks that bound this pair best tend to bound the nodes between them best too
+            table, c = landmarks.table, landmarks.count
+            ranked = sorted(range(c), key=lambda i: -abs(table[target * c + i] - table[source * c + i]))
+            active = [(i, table[target * c + i]) for i in ranked[:constants.ACTIVE_LANDMARKS]]
+        dist = {source: 0.0}
+        prev = {source: -1}
+        heap = [(scale * self._calculate_distance(g.position(source), (gx, gy, gz)), 0.0, source)]
+        while heap:
+            _, d, u = heapq.heappop(heap)
+            if u == target:
+                perf.count('route.astar_reached', len(dist))
+                return self._route((dist, prev), source, target)
+            if d > dist[u]:
+                continue
+            for k in range(offsets[u], offsets[u + 1]):
+                v = neighbors[k]
+                nd = d + weights[k]
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    prev[v] = u
+                    # Edges cost at least `scale` times their straight-line length, so this never overestimates
+                    h = scale * math.sqrt((coords[3 * v] - gx) ** 2 + (coords[3 * v + 1] - gy) ** 2 + (coords[3 * v + 2] - gz) ** 2)
+                    if landmarks is not None:
+                        for i, at_target in active:
+                            bound = abs(table[v * c + i] - at_target)
+                            if bound > h:
+                                h = bound
+                    heapq.heappush(heap, (nd + h, nd, v))
+        perf.count('route.astar_reached', len(dist))
+        return None
+
+    def _route(self, tree, source, target):
+        """Reads the source-to-target path out of a (distances, predecessors) tree."""
+        dist, prev = tree
+        if isinstance(dist, dict):
+            if target not in dist:
+                return None
+        elif dist[target] == math.inf:
+            return None
+        path = [target]
+        while path[-1] != source:
+            path.append(prev[path[-1]])
+        names = self.compact.names
+        return [names[v] for v in reversed(path)], dist[target]
+
+    def _reversed(self, route):
+        if route is None:
+            return None
+        path, distance = route
+        return path[::-1], distance
+
+    def _forms_edge(self, u, v):
+        # Waypoints with a blank ID are not routable
+        return u is not None and v is not None and u != v and bool(self._names[u]) and bool(self._names[v])
 
     def _get_node_name(self, entity):
         for attrib in entity.attribs:
@@ -52,14 +1294,46 @@ class NavigationEngine:
                 return attrib.dxf.text
         return f"Node_{id(entity)}"
 
+    def _build_spatial_index(self):
+        """Buckets waypoints into a uniform grid whose cells are one snapping threshold wide."""
+        self._grid = {}
+        if not self._grid_enabled():
+            return
+        for i in range(len(self._coords) // 3):
+            if self._names[i] is not None:
+                self._grid.setdefault(self._cell_of(self._position(i)), []).append(i)
+
+    def _grid_enabled(self):
+        return 0 < self.threshold < math.inf
+
+    def _cell_of(self, point):
+        return _cell(point, self.threshold)
+
+    def _endpoint_cell(self, point):
+        return _cell(point, self.threshold * _ENDPOINT_CELL)
+
+    def _position(self, i):
+        return (self._coords[3 * i], self._coords[3 * i + 1], self._coords[3 * i + 2])
+
     def _find_closest_node(self, point):
+        """Returns the id of the waypoint that `point` snaps to, or None."""
+        if not self._grid_enabled():
+            return self._find_closest_node_linear(point)
+        if self._grid is None:
+            self._build_spatial_index()
+        # Ties go to the waypoint first in the file, exactly like the linear scan
+        return _nearest(self._grid, point, self.threshold, self._position, self._rank)
+
+    def _find_closest_node_linear(self, point):
         best_node = None
         min_dist = self.threshold
-        for name, pos in self.nodes.items():
-            d = self._calculate_distance(point, pos)
+        for i in range(len(self._coords) // 3):
+            if self._names[i] is None:
+                continue
+            d = self._calculate_distance(point, self._position(i))
             if d < min_dist:
                 min_dist = d
-                best_node = name
+                best_node = i
         return best_node
 
     def _calculate_distance(self, p1, p2):
@@ -0,0 +1,167 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+
+import constants
+
+# Spans and counters are off unless enable() is called (or constants.PERF_ENABLED
+# is set). While off, span() hands back one shared do-nothing context manager and
+# count() returns straight away, so instrumented code pays a call and a flag
+# check. Pass results known only at the end of a span through span.set() rather
+# than keyword arguments to span(), which would build a dict even when disabled.
+
+enabled = constants.PERF_ENABLED
+counters = Counter()  # { "name": total }
+_spans = deque(maxlen=constants.PERF_MAX_SPANS)  # (name, start_ns, duration_ns, thread id, args), oldest first
+_recent = {}  # { "name": deque of the last PERF_WINDOW durations in ns }
+_origin = time.perf_counter_ns()
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter_ns() - self.start
+        _spans.append((self.name, self.start, duration, threading.get_ident(), self.args))
+        recent = _recent.get(self.name)
+        if recent is None:
+            recent = _recent[self.name] = deque(maxlen=constants.PERF_WINDOW)
+        recent.append(duration)
+        return False
+
+    def set(self, **args):
+        """Attaches results to the span, e.g. how many items it processed."""
+        self.args.update(args)
+
+
+def span(name, **args):
+    """Context manager timing the block it wraps under `name` (a no-op while disabled)."""
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def timed(name):
+    """Decorator running the function inside span(name)."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            with _Span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, n=1):
+    """Adds n to counter `name` (a no-op while disabled)."""
+    if enabled:
+        counters[name] += n
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    """Forgets every recorded span and counter."""
+    counters.clear()
+    _spans.clear()
+    _recent.clear()
+
+
+def recent_names():
+    """Names of every span recorded so far, in the order they were first seen."""
+    return list(_recent)
+
+
+def recent_ms(name):
+    """Durations in milliseconds of the last PERF_WINDOW `name` spans, oldest first."""
+    return [d / 1e6 for d in _recent.get(name, ())]
+
+
+def percentiles(values, qs=(50, 95, 99)):
+    """Nearest-rank percentiles of `values` (None for each if there are none)."""
+    ordered = sorted(values)
+    if not ordered:
+        return [None for _ in qs]
+    return [ordered[min(len(ordered) - 1, max(0, -(-q * len(ordered) // 100) - 1))] for q in qs]
+
+
+def summary():
+    """{ 'spans': { name: count, total / mean / p50 / p95 / p99 / max in ms }, 'counters': { name: total } }.
+
+    Covers the spans still held, the last PERF_MAX_SPANS of them.
+    """
+    durations = {}
+    for name, _, duration, _, _ in _spans:
+        durations.setdefault(name, []).append(duration / 1e6)
+    spans = {}
+    for name, values in durations.items():
+        p50, p95, p99 = percentiles(values)
+        spans[name] = {
+            'count': len(values),
+            'total_ms': sum(values),
+            'mean_ms': sum(values) / len(values),
+            'p50_ms': p50,
+            'p95_ms': p95,
+            'p99_ms': p99,
+            'max_ms': max(values),
+        }
+    return {'spans': spans, 'counters': dict(counters)}
+
+
+def chrome_trace():
+    """The recorded spans as a Chrome trace ({ 'traceEvents': [...] }), for chrome://tracing or Perfetto."""
+    pid = os.getpid()
+    events = []
+    end = 0.0
+    for name, start, duration, tid, args in _spans:
+        ts = (start - _origin) / 1000
+        events.append({'name': name, 'ph': 'X', 'ts': ts, 'dur': duration / 1000, 'pid': pid, 'tid': tid, 'args': args})
+        end = max(end, ts + duration / 1000)
+    if counters:
+        events.append({'name': 'counters', 'ph': 'C', 'ts': end, 'pid': pid, 'tid': 0, 'args': dict(counters)})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def write(path):
+    """Writes what was recorded to `path`: a Chrome trace if it ends in .trace or .trace.json, else the summary."""
+    data = chrome_trace() if path.endswith(('.trace', '.trace.json')) else summary()
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1, default=str)
+    print(f"✓ Performance data written to '{path}'")
@@ -0,0 +1,74 @@
+import os
+import time
+
+import graph_cache
+
+
+class PlanWatcher:
+    """Polls a DXF for edits and patches a NavigationEngine's graph with update_graph.
+
+    The engine should have built its graph with track_changes=True, so even
+    the first edit is patched rather than rebuilt.
+    """
+
+    def __init__(self, engine, filename, get_entities, use_cache=True, cache_dir=None, use_landmarks=False,
+                 max_workers=None):
+        self.engine = engine
+        self.filename = filename
+        self.get_entities = get_entities  # re-reads the plan, e.g. dxf_loader.stream_entities
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
+        # Any change to the graph drops its landmarks; with this set they are rebuilt (and stored) after each edit
+        self.use_landmarks = use_landmarks
+        self.max_workers = max_workers
+        self.key = None  # graph cache key the graph was last saved under
+        self._stamp = self._stat()
+        self._failed = None  # stamp of the last save that could not be applied
+        engine.track_changes = True
+
+    def _stat(self):
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def poll(self):
+        """Applies the plan's edits if the file changed since the last poll; returns True if the graph changed."""
+        stamp = self._stat()
+        if stamp is None or stamp == self._stamp:
+            return False
+        # Most likely caught mid-save: keep the current graph, and the old
+        # stamp so the next poll tries again; report each failing save once
+        try:
+            self.engine.update_graph(self.get_entities())
+        except IOError:
+            if stamp != self._failed:
+                print(f"ERROR: Cannot read file '{self.filename}'")
+            self._failed = stamp
+            return False
+        except Exception as e:
+            if stamp != self._failed:
+                print(f"ERROR: {e}")
+            self._failed = stamp
+            return False
+        self._stamp = stamp
+        self._failed = None
+
+        if self.use_cache:
+            self.key = graph_cache.cache_key(self.filename, self.engine.threshold, self.engine.topology)
+            try:
+                graph_cache.save_graph(self.filename, self.engine.threshold, self.engine.compact, self.cache_dir, self.key)
+            except OSError as e:
+                print(f"WARNING: Graph not cached: {e}")
+        if self.use_landmarks:
+            import landmarks  # NumPy is only needed with landmarks
+            landmarks.load_or_build(self.engine, self.filename, max_workers=self.max_workers, cache_dir=self.cache_dir)
+        return True
+
+    def watch(self, interval=1.0, on_change=None):
+        """Polls every `interval` seconds until interrupted, calling on_change() after each applied edit."""
+        while True:
+            time.sleep(interval)
+            if self.poll() and on_change is not None:
+                on_change()
@@ -0,0 +1,314 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import constants
+import graph_cache
+import headless
+import landmarks
+import nav_engine
+import plan_watch
+
+# Per worker process: the graph it last mapped in, the cache key it came from
+# and the version of the runtime weight changes applied to it
+_engine = None
+_engine_key = None
+_engine_version = None
+
+
+def _load_worker_engine(filename, snapping_threshold, cache_dir, key):
+    """Worker: maps the cached graph for `key` in, with its landmarks if there are any, replacing the one held so far."""
+    global _engine, _engine_key, _engine_version
+    engine = nav_engine.NavigationEngine(snapping_threshold=snapping_threshold)
+    compact = graph_cache.load_graph(filename, snapping_threshold, cache_dir, key)
+    if compact is not None:
+        engine.load_compact(compact)
+        engine.use_landmarks(landmarks.load_landmarks(filename, key, compact, cache_dir=cache_dir))
+    else:
+        # Cache unavailable on this platform: build in-process instead
+        engine = headless.load_engine(filename, snapping_threshold, use_cache=False)
+    _engine, _engine_key, _engine_version = engine, key, None
+
+
+def _search(filename, snapping_threshold, cache_dir, key, dynamic, source, target):
+    """Worker: one route query on the graph for `key`, loading that graph first if it is not the one held.
+
+    dynamic is (version, NavigationEngine.dynamic_state()); the state is
+    applied whenever its version differs from the one the worker has.
+    """
+    global _engine_version
+    if _engine_key != key:
+        _load_worker_engine(filename, snapping_threshold, cache_dir, key)
+    version, state = dynamic
+    if _engine_version != version:
+        _engine.set_dynamic_state(state)
+        _engine_version = version
+    return _engine.shortest_path(source, target)
+
+
+def _reversed(route):
+    if route is None:
+        return None
+    path, distance = route
+    return path[::-1], distance
+
+
+class RouteService:
+    """Answers route queries for one DXF over HTTP, with the searches run in worker processes.
+
+    The parent builds the graph once and writes it to the graph cache; every
+    worker maps that file in and keeps it between queries. Answered routes
+    are kept in a bounded LRU cache, and a query that is already being
+    searched for waits on that search instead of starting its own. Walking
+    paths are bi-directional, so A -> B and B -> A share both. With
+    watch=True edits to the DXF are patched in (see PlanWatcher), after
+    which the route cache is dropped and workers reload on their next query.
+    Closures and weight changes (see change) reach every worker with its
+    next query, and drop only the cached routes they could alter. Workers
+    search with landmark distances (see landmarks.py) whenever they are
+    stored for the graph they map; use_landmarks=True builds them if they
+    are not. Graphs patched in by the watcher go without.
+    """
+
+    def __init__(self, filename, snapping_threshold=constants.SNAPPING_THRESHOLD, cache_dir=None,
+                 max_workers=None, cache_size=constants.ROUTE_CACHE_SIZE, watch=False, use_landmarks=False):
+        self.filename = filename
+        self.threshold = snapping_threshold
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.cache_size = cache_size
+        self.watch = watch
+        self.use_landmarks = use_landmarks
+        self.engine = None
+        self.key = None  # graph cache key of the current graph; workers compare against it
+        self.dynamic = (0, None)  # (version, engine.dynamic_state()) of the runtime weight changes
+        self.routes = OrderedDict()  # { (source, target): route }, least recently used first
+        self._pending = {}  # { (source, target): future of the search in flight }
+        self.stats = Counter()  # hits, searches, coalesced, rebuilds, changes, routes_dropped
+        self._pool = None
+        self._watcher = None
+        self._engine_lock = asyncio.Lock()  # the watcher's patches and runtime changes take turns on the engine
+
+    def load(self):
+        """Builds or loads the graph and makes sure it is in the graph cache for the workers."""
+        self.engine = headless.load_engine(self.filename, self.threshold, cache_dir=self.cache_dir,
+                                           track_changes=self.watch)
+        self.key = graph_cache.cache_key(self.filename, self.threshold, self.engine.topology)
+        self.dynamic = (0, self.engine.dynamic_state())
+        if self.watch:
+            # A tracked engine skips the cache, so write it here for the workers (they build their own without it)
+            try:
+                graph_cache.save_graph(self.filename, self.threshold, self.engine.compact, self.cache_dir, self.key)
+            except OSError as e:
+                print(f"WARNING: Graph not cached: {e}")
+            self._watcher = plan_watch.PlanWatcher(self.engine, self.filename, headless.entity_reader(self.filename),
+                                                   cache_dir=self.cache_dir, use_landmarks=self.use_landmarks,
+                                                   max_workers=self.max_workers)
+        if self.use_landmarks:
+            landmarks.load_or_build(self.engine, self.filename, max_workers=self.max_workers, cache_dir=self.cache_dir)
+
+    def invalidate(self, key):
+        """Switches to the graph cached under `key` and forgets every cached route.
+
+        Searches still in flight answer their callers but are not cached.
+        """
+        self.key = key
+        self.routes.clear()
+        self._pending.clear()
+        self.stats['rebuilds'] += 1
+
+    async def change(self, action, *args):
+        """Applies a runtime change, e.g. change('block_edge', 'A', 'B'), and drops the cached routes it could alter.
+
+        action names one of NavigationEngine's set_edge_weight, block_edge,
+        unblock_edge, block_node or unblock_node. Searches still in flight
+        answer their callers but are not cached. Returns (edges changed,
+        cached routes dropped); raises KeyError or ValueError like the engine.
+        """
+        async with self._engine_lock:
+            changes = await asyncio.get_running_loop().run_in_executor(None, getattr(self.engine, action), *args)
+        if not changes:
+            return 0, 0
+        self.dynamic = (self.dynamic[0] + 1, self.engine.dynamic_state())
+        self._pending.clear()
+        stale = [query for query, route in self.routes.items() if self.engine.route_stale(route, changes)]
+        for query in stale:
+            del self.routes[query]
+        self.stats['changes'] += 1
+        self.stats['routes_dropped'] += len(stale)
+        return len(changes) // 2, len(stale)
+
+    async def route(self, source, target):
+        """Returns (path, distance) or None, like NavigationEngine.shortest_path; raises KeyError for unknown waypoints."""
+        flip = target < source
+        query = (target, source) if flip else (source, target)
+
+        if query in self.routes:
+            self.routes.move_to_end(query)
+            self.stats['hits'] += 1
+            route = self.routes[query]
+        elif query in self._pending:
+            self.stats['coalesced'] += 1
+            # Shielded, so a client hanging up does not cancel the search for the others
+            route = await asyncio.shield(self._pending[query])
+        else:
+            self.stats['searches'] += 1
+            key, dynamic = self.key, self.dynamic
+            future = asyncio.get_running_loop().run_in_executor(
+                self._pool, _search, self.filename, self.threshold, self.cache_dir, key, dynamic, *query)
+            self._pending[query] = future
+            future.add_done_callback(lambda f: self._finish(query, (key, dynamic[0]), f))
+            route = await asyncio.shield(future)
+        return _reversed(route) if flip else route
+
+    def _finish(self, query, generation, future):
+        if self._pending.get(query) is future:
+            del self._pending[query]
+        if future.cancelled() or future.exception() is not None or generation != (self.key, self.dynamic[0]):
+            return
+        self.routes[query] = future.result()
+        if len(self.routes) > self.cache_size:
+            self.routes.popitem(last=False)
+
+    async def serve(self, host='127.0.0.1', port=constants.ROUTE_SERVICE_PORT, unix_path=None, poll_interval=1.0):
+        """Serves until cancelled, on a Unix socket if unix_path is given, else on host:port."""
+        # Spawned, not forked: the event loop and the watcher's thread must not be copied mid-flight
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                         initializer=_load_worker_engine,
+                                         initargs=(self.filename, self.threshold, self.cache_dir, self.key))
+        try:
+            if unix_path is not None:
+                server = await asyncio.start_unix_server(self._handle, path=unix_path)
+                where = unix_path
+            else:
+                server = await asyncio.start_server(self._handle, host, port)
+                where = f"http://{host}:{port}"
+            print(f"✓ Route service listening on {where} ({self.max_workers} workers)")
+            async with server:
+                if self._watcher is not None:
+                    await asyncio.gather(server.serve_forever(), self._watch(poll_interval))
+                else:
+                    await server.serve_forever()
+        finally:
+            self._pool.shutdown(cancel_futures=True)
+
+    async def _watch(self, interval):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            # Only the parent's engine is touched, and only the workers answer queries
+            async with self._engine_lock:
+                rebuilt = await loop.run_in_executor(None, self._watcher.poll)
+            if rebuilt:
+                self.invalidate(self._watcher.key)
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while await reader.readline() not in (b'\r\n', b'\n', b''):
+                pass  # headers are not needed
+            status, body = await self._respond(request.decode('latin-1'))
+            payload = json.dumps(body).encode('utf-8')
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode('ascii') + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, request_line):
+        """Returns (status line, JSON body) for one request line."""
+        parts = request_line.split()
+        if len(parts) != 3 or parts[0] not in ('GET', 'POST'):
+            return '400 Bad Request', {'error': "only GET /route?source=...&target=..., GET /stats and "
+                                                "POST /block, /unblock or /weight"}
+        method, url = parts[0], urlsplit(parts[1])
+        query = parse_qs(url.query)
+        source, target = query.get('source', [None])[0], query.get('target', [None])[0]
+
+        if url.path in ('/block', '/unblock', '/weight'):
+            if method != 'POST':
+                return '405 Method Not Allowed', {'error': f"use POST {url.path}"}
+            return await self._change(url.path, query, source, target)
+        if url.path == '/stats':
+            return '200 OK', {**self.stats, 'cached_routes': len(self.routes), 'in_flight': len(self._pending)}
+        if url.path != '/route':
+            return '404 Not Found', {'error': f"no such endpoint '{url.path}'"}
+
+        if source is None or target is None:
+            return '400 Bad Request', {'error': "give both source and target"}
+        try:
+            route = await self.route(source, target)
+        except KeyError as e:
+            return '404 Not Found', {'error': e.args[0]}
+        if route is None:
+            return '200 OK', {'source': source, 'target': target, 'path': None, 'distance': None}
+        path, distance = route
+        return '200 OK', {'source': source, 'target': target, 'path': path, 'distance': distance}
+
+    async def _change(self, endpoint, query, source, target):
+        """POST /block and /unblock take ?node=... or ?source=...&target=...; /weight takes source, target and weight."""
+        node = query.get('node', [None])[0]
+        weight = query.get('weight', [None])[0]
+        try:
+            if endpoint == '/weight':
+                if source is None or target is None:
+                    return '400 Bad Request', {'error': "give source and target, and weight (omit it to restore the length)"}
+                edges, dropped = await self.change('set_edge_weight', source, target,
+                                                   float(weight) if weight is not None else None)
+            elif node is not None:
+                edges, dropped = await self.change(f"{endpoint[1:]}_node", node)
+            elif source is not None and target is not None:
+                edges, dropped = await self.change(f"{endpoint[1:]}_edge", source, target)
+            else:
+                return '400 Bad Request', {'error': "give node, or source and target"}
+        except KeyError as e:
+            return '404 Not Found', {'error': e.args[0]}
+        except ValueError as e:
+            return '400 Bad Request', {'error': str(e)}
+        return '200 OK', {'edges_changed': edges, 'routes_dropped': dropped}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve route queries on a DXF floor plan over local HTTP.")
+    parser.add_argument('filename', help="DXF floor plan")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    parser.add_argument('--port', type=int, default=constants.ROUTE_SERVICE_PORT, help="port to listen on")
+    parser.add_argument('--unix', metavar='PATH', help="listen on this Unix socket instead of a TCP port")
+    parser.add_argument('--workers', type=int, default=None, help="search processes (default: one per CPU)")
+    parser.add_argument('--threshold', type=float, default=constants.SNAPPING_THRESHOLD, help="snapping threshold")
+    parser.add_argument('--watch', action='store_true', help="patch edits to the DXF into the graph while serving")
+    parser.add_argument('--landmarks', action='store_true', help="search with landmark distances, built once per plan "
+                                                                 "and kept beside the graph cache")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.filename):
+        print(f"ERROR: File '{args.filename}' not found.")
+        sys.exit(1)
+
+    service = RouteService(args.filename, args.threshold, max_workers=args.workers, watch=args.watch,
+                           use_landmarks=args.landmarks)
+    try:
+        service.load()
+    except IOError:
+        print(f"ERROR: Cannot read file '{args.filename}'")
+        sys.exit(1)
+    except Exception as e:
+        print(f"ERROR: {e}")
+        sys.exit(3)
+
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import io
+import math
+import random
+
+import ezdxf
+
+import constants
+
+# Distance between neighbouring rooms, in drawing units (the demo plan is in millimetres)
+ROOM_SPACING = 3000.0
+WAYPOINT_BLOCK = 'waypoint'
+
+_INSERT = ("  0\nINSERT\n  5\n{h:X}\n330\n{owner}\n100\nAcDbEntity\n  8\n{layer}\n100\nAcDbBlockReference\n"
+           " 66\n1\n  2\n{block}\n 10\n{x!r}\n 20\n{y!r}\n 30\n0.0\n"
+           "  0\nATTRIB\n  5\n{ha:X}\n330\n{h:X}\n100\nAcDbEntity\n  8\n{layer}\n100\nAcDbText\n"
+           " 10\n{tx!r}\n 20\n{y!r}\n 30\n0.0\n 40\n250.0\n  1\n{name}\n100\nAcDbAttribute\n  2\nID\n 70\n0\n"
+           "  0\nSEQEND\n  5\n{hs:X}\n330\n{h:X}\n100\nAcDbEntity\n  8\n{layer}\n")
+_LINE = ("  0\nLINE\n  5\n{h:X}\n330\n{owner}\n100\nAcDbEntity\n  8\n{layer}\n100\nAcDbLine\n"
+         " 10\n{x0!r}\n 20\n{y0!r}\n 30\n0.0\n 11\n{x1!r}\n 21\n{y1!r}\n 31\n0.0\n")
+
+
+def _template():
+    """An empty plan with the navigation layers and the waypoint block, as DXF text split around its ENTITIES section.
+
+    Returns (head, tail, modelspace handle, first free handle).
+    """
+    doc = ezdxf.new('R2010')
+    doc.layers.add(constants.TRACK_LAYER)
+    block = doc.blocks.new(WAYPOINT_BLOCK)
+    block.add_circle((0, 0), 300)
+    block.add_attdef('ID', (400, 0), dxfattribs={'height': 250})
+    stream = io.StringIO()
+    doc.write(stream)
+    text = stream.getvalue()
+    split = text.index("  2\nENTITIES\n") + len("  2\nENTITIES\n")
+    return text[:split], text[split:], doc.modelspace().layout_key, int(doc.header['$HANDSEED'], 16)
+
+
+def write_plan(path, elements, seed=0, spacing=ROOM_SPACING):
+    """Writes a synthetic floor plan of about `elements` entities to `path`; returns (waypoints, tracklines, walls).
+
+    Rooms sit on a jittered square grid, each with a waypoint INSERT carrying an
+    ID attribute on the waypoint layer, trackline LINEs to its right and upper
+    neighbours (a few left out, as dead corridors) and a wall LINE on layer 0.
+    Entities are written as DXF text straight into the file, so any size fits in
+    memory; the header and tables come from an ezdxf template.
+    """
+    rnd = random.Random(seed)
+    side = max(2, math.ceil(math.sqrt(elements / 4)))
+    head, tail, owner, handle = _template()
+
+    jitter = spacing * 0.1
+    points = [[(i * spacing + rnd.uniform(-jitter, jitter), j * spacing + rnd.uniform(-jitter, jitter))
+               for j in range(side)] for i in range(side)]
+
+    # The header's next free handle must stay above every handle written; each room takes at most six
+    seed_at = head.index("$HANDSEED\n  5\n") + len("$HANDSEED\n  5\n")
+    head = head[:seed_at] + f"{handle + 6 * side * side:X}" + head[head.index("\n", seed_at):]
+
+    counts = [0, 0, 0]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(head)
+        for i in range(side):
+            for j in range(side):
+                x, y = points[i][j]
+                f.write(_INSERT.format(h=handle, ha=handle + 1, hs=handle + 2, owner=owner, layer=constants.WAYPOINT_LAYER,
+                                          block=WAYPOINT_BLOCK, x=x, y=y, tx=x + 400.0, name=f"R{i}-{j}"))
+                handle += 3
+                counts[0] += 1
+                for ni, nj in ((i + 1, j), (i, j + 1)):
+                    if ni < side and nj < side and rnd.random() >= 0.03:
+                        x1, y1 = points[ni][nj]
+                        f.write(_LINE.format(h=handle, owner=owner, layer=constants.TRACK_LAYER, x0=x, y0=y, x1=x1, y1=y1))
+                        handle += 1
+                        counts[1] += 1
+                wx, wy = (i - 0.5) * spacing, (j - 0.5) * spacing
+                f.write(_LINE.format(h=handle, owner=owner, layer='0', x0=wx, y0=wy, x1=wx + spacing, y1=wy))
+                handle += 1
+                counts[2] += 1
+        f.write(tail)
+    return tuple(counts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic DXF floor plan for benchmarking.")
+    parser.add_argument('filename', help="DXF file to write")
+    parser.add_argument('--elements', type=int, default=10000, help="approximate number of entities")
+    parser.add_argument('--seed', type=int, default=0, help="random seed")
+    args = parser.parse_args(argv)
+
+    waypoints, tracklines, walls = write_plan(args.filename, args.elements, args.seed)
+    print(f"✓ Wrote '{args.filename}': {waypoints} waypoints, {tracklines} track lines, {walls} walls")
+
+
+if __name__ == "__main__":
+    main()
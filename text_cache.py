@@ -0,0 +1,63 @@
+from collections import OrderedDict
+
+import constants
+
+
+class TextCache:
+    """LRU-bounded cache of rendered text surfaces for one font, keyed by (text, color)."""
+
+    def __init__(self, font, max_entries=constants.TEXT_CACHE_SIZE):
+        self.font = font
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()  # { (text, color): Surface }, least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    def size(self, text, color):
+        """(width, height) the text renders at, without rendering it if it isn't cached."""
+        surface = self.surfaces.get((text, color))
+        if surface is not None:
+            return surface.get_size()
+        return self.font.size(text)
+
+    def render(self, text, color):
+        key = (text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = self.font.render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surface
+
+
+class LabelPlacer:
+    """Remembers where labels were drawn this frame so overlapping ones can be skipped."""
+
+    def __init__(self, cell_size=constants.LABEL_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}  # { (cell_x, cell_y): [Rect, ...] }
+
+    def blocked(self, x, y):
+        """True if (x, y) already lies inside a placed label: a cheap reject before measuring text."""
+        placed = self.cells.get((x // self.cell_size, y // self.cell_size))
+        return bool(placed) and any(rect.collidepoint(x, y) for rect in placed)
+
+    def place(self, rect):
+        """Claims rect and returns True, or returns False if it overlaps an earlier label."""
+        size = self.cell_size
+        keys = [(cx, cy)
+                for cx in range(rect.left // size, (rect.right - 1) // size + 1)
+                for cy in range(rect.top // size, (rect.bottom - 1) // size + 1)]
+        for key in keys:
+            placed = self.cells.get(key)
+            if placed and rect.collidelist(placed) != -1:
+                return False
+        for key in keys:
+            self.cells.setdefault(key, []).append(rect)
+        return True